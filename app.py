@@ -4,20 +4,54 @@ Flask Application
 Main Flask application with REST API and WebSocket support.
 """
 
-from flask import Flask, jsonify, request, send_from_directory, send_file
+# eventlet must patch the standard library before anything else imports it
+from config import SOCKETIO_ASYNC_MODE
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from flask import Flask, Response, g, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import threading
 import time
 import os
+import fcntl
+import hashlib
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from config import HOST, PORT, DEBUG, WEBSOCKET_CORS_ALLOWED_ORIGINS
-from drive_detector import DriveDetector
+# Try to import orjson for faster JSON responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+# Try to import WhiteNoise for serving the built frontend
+try:
+    from whitenoise import WhiteNoise
+    WHITENOISE_AVAILABLE = True
+except ImportError:
+    WHITENOISE_AVAILABLE = False
+    WhiteNoise = None
+
+from config import (
+    HOST, PORT, DEBUG, WEBSOCKET_CORS_ALLOWED_ORIGINS, SOCKETIO_MESSAGE_QUEUE,
+    PROGRESS_EMIT_INTERVAL,
+    DRIVE_SCAN_INTERVAL, RUN_SCANNER, SCAN_LOCK_FILE, LOG_LEVEL
+)
+from database import get_db, bind_request_session, release_request_session
+from drive_detector import DriveDetector, DriveInfo
 from test_executor import TestExecutor, TestStatus
 from db_operations import (
-    get_or_create_drive, get_drive_by_serial, get_drive_by_bay,
+    get_or_create_drive, bulk_upsert_drives, get_drive_by_serial, get_drive_by_bay,
     get_or_create_active_session, get_active_session, update_po_number,
     create_test_session, update_test_session, add_test_result,
     get_setting, set_setting, get_all_settings,
@@ -26,21 +60,99 @@ from db_operations import (
     add_log
 )
 
+logger = logging.getLogger(__name__)
+
+
+def configure_logging():
+    """
+    Route log records through a queue to a background listener.
+    
+    Callers only enqueue records; formatting and the write to stderr
+    happen on the listener thread, off the request and emit paths.
+    """
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+
+configure_logging()
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify() backed by orjson; keys are sorted and types orjson can't encode go through Flask's default"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        ).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = ORJSONProvider(app)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins=WEBSOCKET_CORS_ALLOWED_ORIGINS)
+socketio = SocketIO(app, cors_allowed_origins=WEBSOCKET_CORS_ALLOWED_ORIGINS,
+                    async_mode=SOCKETIO_ASYNC_MODE, message_queue=SOCKETIO_MESSAGE_QUEUE)
 
 # Frontend paths
 FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(__file__), 'frontend', 'build')
 FRONTEND_DEV_DIR = os.path.join(os.path.dirname(__file__), 'frontend', 'public')
+FRONTEND_INDEX_PATH = os.path.join(FRONTEND_BUILD_DIR, 'index.html')
+
+# index.html is fixed for the life of the process; read it once
+FRONTEND_INDEX_HTML: Optional[bytes] = None
+if os.path.isfile(FRONTEND_INDEX_PATH):
+    with open(FRONTEND_INDEX_PATH, 'rb') as f:
+        FRONTEND_INDEX_HTML = f.read()
+
+# Serve built frontend files straight from the WSGI layer (cached metadata,
+# ETags, no Flask routing); serve_frontend only handles SPA fallback routes
+if WHITENOISE_AVAILABLE and os.path.isdir(FRONTEND_BUILD_DIR):
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=FRONTEND_BUILD_DIR, index_file=True)
 
 # Global instances
 drive_detector = DriveDetector()
 test_executor = TestExecutor()
 
-# Background thread for drive scanning
+# Background task for drive scanning
 scanning_thread = None
 scanning_active = False
+last_drive_fingerprint = None
+
+# Latest test progress per drive serial, flushed to clients in batches
+pending_progress: Dict[str, Dict] = {}
+pending_progress_lock = threading.Lock()
+progress_thread = None
+scan_lock_handle = None
+
+
+@app.before_request
+def open_db_session():
+    """Give the request one database session shared by every helper it calls"""
+    g.db_session_token = bind_request_session()
+
+
+@app.teardown_request
+def remove_db_session(exception=None):
+    """Release the request's database session back to the pool"""
+    token = g.pop('db_session_token', None)
+    if token is not None:
+        release_request_session(token)
+    else:
+        get_db().remove_session()
 
 
 # ============================================================================
@@ -48,77 +160,109 @@ scanning_active = False
 # ============================================================================
 
 def start_drive_scanning():
-    """Background thread to periodically scan for drives"""
-    global scanning_active
+    """Background task to periodically scan for drives"""
+    global scanning_active, last_drive_fingerprint
     scanning_active = True
     
     while scanning_active:
+        # Start scans on a fixed cadence regardless of how long each scan takes
+        next_scan = time.monotonic() + DRIVE_SCAN_INTERVAL
         try:
-            # Scan drives
+            # Scan drives (refreshes the snapshot served to API handlers)
             drives = drive_detector.scan_drives()
+            scanned_at = datetime.now().isoformat()
             
-            # Update database
-            for device_path, drive_info in drives.items():
-                if drive_info.serial:
-                    get_or_create_drive(
-                        serial=drive_info.serial,
-                        model=drive_info.model,
-                        capacity=drive_info.capacity,
-                        connection_type=drive_info.connection_type,
-                        sata_version=drive_info.sata_version,
-                        bay_location=drive_info.bay_number,
-                        device_path=drive_info.device_path,
-                        stable_path=drive_info.stable_path,
-                        scsi_host=drive_info.scsi_host,
-                        scsi_channel=drive_info.scsi_channel,
-                        scsi_target=drive_info.scsi_target,
-                        scsi_lun=drive_info.scsi_lun
-                    )
+            # Update database (one transaction for all drives)
+            bulk_upsert_drives(list(drives.values()))
             
-            # Emit WebSocket update
-            socketio.emit('drives_updated', {
-                'count': len(drives),
-                'timestamp': datetime.now().isoformat()
-            })
+            # Emit WebSocket update only when drives were added, removed or moved
+            fingerprint = drive_detector.fingerprint
+            if fingerprint != last_drive_fingerprint:
+                last_drive_fingerprint = fingerprint
+                socketio.emit('drives_updated', {
+                    'count': len(drives),
+                    'timestamp': scanned_at
+                })
             
-            # Sleep before next scan
-            time.sleep(5)  # Scan every 5 seconds
+            # Sleep until the next scan is due (yields to the WebSocket loop)
+            socketio.sleep(max(0.0, next_scan - time.monotonic()))
             
         except Exception as e:
-            print(f"Error in drive scanning: {e}")
-            time.sleep(10)
+            logger.exception("Error in drive scanning: %s", e)
+            socketio.sleep(10)
+
+
+def queue_test_progress(serial: str, progress_data: Dict):
+    """Record the latest progress for a drive; older unsent updates are dropped"""
+    with pending_progress_lock:
+        pending_progress[serial] = progress_data
+
+
+def flush_test_progress():
+    """Background task to send queued test progress as one batched emit"""
+    while True:
+        socketio.sleep(PROGRESS_EMIT_INTERVAL)
+        
+        with pending_progress_lock:
+            if not pending_progress:
+                continue
+            updates = list(pending_progress.values())
+            pending_progress.clear()
+        
+        try:
+            socketio.emit('test_progress', {'updates': updates})
+        except Exception as e:
+            logger.exception("Error emitting test progress: %s", e)
 
 
 # ============================================================================
 # REST API Endpoints - Drives
 # ============================================================================
 
+def stream_json_list(fields: Dict, list_key: str, items: List, etag: str) -> Response:
+    """
+    Stream a JSON object whose list_key array is encoded one item at a time.
+    
+    The scalar fields are sent first, so bytes reach the client while the
+    remaining items are still being encoded.
+    """
+    def generate():
+        # fields is non-empty, so its encoding ends with '}' that we reopen
+        yield app.json.dumps(fields)[:-1] + f',"{list_key}":['
+        for index, item in enumerate(items):
+            yield (',' if index else '') + app.json.dumps(item)
+        yield ']}\n'
+    
+    response = Response(generate(), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def etag_not_modified(etag: str) -> Optional[Response]:
+    """Return a 304 response if the client already holds this ETag"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
 @app.route('/api/drives', methods=['GET'])
 def list_drives():
     """List all detected drives"""
     try:
-        drives = drive_detector.scan_drives()
-        drives_list = []
-        
-        for device_path, drive_info in drives.items():
-            drives_list.append({
-                'device_path': drive_info.device_path,
-                'device_name': drive_info.device_name,
-                'serial': drive_info.serial,
-                'model': drive_info.model,
-                'capacity': drive_info.capacity,
-                'connection_type': drive_info.connection_type,
-                'sata_version': drive_info.sata_version,
-                'bay_number': drive_info.bay_number,
-                'stable_path': drive_info.stable_path,
-                'scsi_path': f"{drive_info.scsi_host}:{drive_info.scsi_channel}:{drive_info.scsi_target}:{drive_info.scsi_lun}" if drive_info.scsi_target is not None else None
-            })
+        # Serialized once per scan by the detector
+        etag, drives_list = drive_detector.get_cached_drives_json()
         
-        return jsonify({
-            'success': True,
-            'drives': drives_list,
-            'count': len(drives_list)
-        })
+        # Unchanged drive list: skip sending the body
+        not_modified = etag_not_modified(etag)
+        if not_modified:
+            return not_modified
+        
+        return stream_json_list(
+            {'success': True, 'count': len(drives_list)},
+            'drives', drives_list, etag
+        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -127,27 +271,14 @@ def list_drives():
 def get_drive(serial: str):
     """Get drive details by serial number"""
     try:
-        drive_info = drive_detector.get_drive_by_path(None)  # Would need to find by serial
-        # For now, scan and find
-        drives = drive_detector.scan_drives()
-        for device_path, info in drives.items():
-            if info.serial == serial:
-                return jsonify({
-                    'success': True,
-                    'drive': {
-                        'device_path': info.device_path,
-                        'device_name': info.device_name,
-                        'serial': info.serial,
-                        'model': info.model,
-                        'capacity': info.capacity,
-                        'connection_type': info.connection_type,
-                        'sata_version': info.sata_version,
-                        'bay_number': info.bay_number,
-                        'stable_path': info.stable_path
-                    }
-                })
+        info = drive_detector.get_drive_by_serial(serial)
+        if not info:
+            return jsonify({'success': False, 'error': 'Drive not found'}), 404
         
-        return jsonify({'success': False, 'error': 'Drive not found'}), 404
+        return jsonify({
+            'success': True,
+            'drive': info.to_dict()
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -160,12 +291,7 @@ def start_test(serial: str):
         test_type = data.get('test_type', 'smart')
         
         # Find drive
-        drives = drive_detector.scan_drives()
-        drive_info = None
-        for device_path, info in drives.items():
-            if info.serial == serial:
-                drive_info = info
-                break
+        drive_info = drive_detector.get_drive_by_serial(serial)
         
         if not drive_info:
             return jsonify({'success': False, 'error': 'Drive not found'}), 404
@@ -183,7 +309,7 @@ def start_test(serial: str):
         
         # Start test
         def progress_callback(progress_data):
-            socketio.emit('test_progress', {
+            queue_test_progress(serial, {
                 'serial': serial,
                 'bay_number': drive_info.bay_number,
                 **progress_data
@@ -196,6 +322,7 @@ def start_test(serial: str):
         )
         
         if success:
+            test_executor.register_serial(serial, drive_info.device_path)
             add_log('INFO', f"Test started on drive {serial}: {test_type}")
             return jsonify({
                 'success': True,
@@ -210,21 +337,27 @@ def start_test(serial: str):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def tested_device_path(serial: str, drive_info: DriveInfo) -> Optional[str]:
+    """
+    Device path of the drive's last test, if the drive is still at that path.
+    
+    A pulled drive's /dev name can be reused by another drive, whose test
+    must not be reported or cancelled for this serial.
+    """
+    device_path = test_executor.device_path_for_serial(serial)
+    return device_path if device_path == drive_info.device_path else None
+
+
 @app.route('/api/drives/<serial>/test', methods=['GET'])
 def get_test_status(serial: str):
     """Get current test status for a drive"""
     try:
-        drives = drive_detector.scan_drives()
-        drive_info = None
-        for device_path, info in drives.items():
-            if info.serial == serial:
-                drive_info = info
-                break
-        
+        drive_info = drive_detector.get_drive_by_serial(serial)
         if not drive_info:
             return jsonify({'success': False, 'error': 'Drive not found'}), 404
         
-        progress = test_executor.get_progress(drive_info.device_path)
+        device_path = tested_device_path(serial, drive_info)
+        progress = test_executor.get_progress(device_path) if device_path else None
         
         if progress:
             return jsonify({
@@ -248,17 +381,12 @@ def get_test_status(serial: str):
 def cancel_test(serial: str):
     """Cancel a running test"""
     try:
-        drives = drive_detector.scan_drives()
-        drive_info = None
-        for device_path, info in drives.items():
-            if info.serial == serial:
-                drive_info = info
-                break
-        
+        drive_info = drive_detector.get_drive_by_serial(serial)
         if not drive_info:
             return jsonify({'success': False, 'error': 'Drive not found'}), 404
         
-        success = test_executor.stop_test(drive_info.device_path)
+        device_path = tested_device_path(serial, drive_info)
+        success = test_executor.stop_test(device_path) if device_path else False
         
         if success:
             add_log('INFO', f"Test cancelled on drive {serial}")
@@ -277,12 +405,24 @@ def cancel_test(serial: str):
 def get_bay_map():
     """Get visual bay mapping"""
     try:
-        drives = drive_detector.scan_drives()
-        bay_map = drive_detector.get_bay_map()
+        # Drives and bay index come from the same scan so the two always agree
+        drives, bay_map, drives_etag = drive_detector.get_cached_bay_snapshot()
+        running = test_executor.get_running_device_paths()
         
         # Get backplane config
         bp_config = get_backplane_config()
         
+        # The response depends on drives, running tests and the configured bay count
+        etag_source = '|'.join([
+            drives_etag,
+            ','.join(sorted(running)),
+            str(bp_config.total_bays if bp_config else None)
+        ])
+        etag = hashlib.sha1(etag_source.encode()).hexdigest()
+        not_modified = etag_not_modified(etag)
+        if not_modified:
+            return not_modified
+        
         # Determine total bays
         if bp_config and bp_config.total_bays:
             total_bays = bp_config.total_bays
@@ -300,15 +440,10 @@ def get_bay_map():
             if bay_num in bay_map:
                 drive_info = bay_map[bay_num]
                 bays.append({
+                    **drive_info.to_dict(),
                     'bay_number': bay_num,
                     'occupied': True,
-                    'device_path': drive_info.device_path,
-                    'serial': drive_info.serial,
-                    'model': drive_info.model,
-                    'capacity': drive_info.capacity,
-                    'connection_type': drive_info.connection_type,
-                    'sata_version': drive_info.sata_version,
-                    'test_running': test_executor.is_test_running(drive_info.device_path),
+                    'test_running': drive_info.device_path in running,
                     'test_progress': None  # Will be filled if test running
                 })
             else:
@@ -321,21 +456,15 @@ def get_bay_map():
         if not bay_map and drives:
             for idx, (device_path, drive_info) in enumerate(drives.items()):
                 bays.append({
+                    **drive_info.to_dict(),
                     'bay_number': idx,
                     'occupied': True,
-                    'device_path': drive_info.device_path,
-                    'serial': drive_info.serial,
-                    'model': drive_info.model,
-                    'capacity': drive_info.capacity,
-                    'connection_type': drive_info.connection_type,
-                    'sata_version': drive_info.sata_version,
-                    'test_running': test_executor.is_test_running(drive_info.device_path),
+                    'test_running': drive_info.device_path in running,
                     'test_progress': None
                 })
         
-        return jsonify({
+        return stream_json_list({
             'success': True,
-            'bays': bays,
             'total_bays': len(bays) if bays else total_bays,
             'occupied_bays': len(bay_map) if bay_map else (len(drives) if drives else 0),
             'debug': {
@@ -343,7 +472,7 @@ def get_bay_map():
                 'bays_mapped': len(bay_map),
                 'backplane_configured': bp_config is not None
             }
-        })
+        }, 'bays', bays, etag)
     except Exception as e:
         import traceback
         return jsonify({
@@ -370,14 +499,7 @@ def get_bay_details(bay_number: int):
             'success': True,
             'bay_number': bay_number,
             'occupied': True,
-            'drive': {
-                'device_path': drive_info.device_path,
-                'serial': drive_info.serial,
-                'model': drive_info.model,
-                'capacity': drive_info.capacity,
-                'connection_type': drive_info.connection_type,
-                'sata_version': drive_info.sata_version
-            }
+            'drive': drive_info.to_dict()
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -635,7 +757,7 @@ def update_backplane_config_endpoint():
 def get_system_status():
     """Get system status"""
     try:
-        drives = drive_detector.scan_drives()
+        drives = drive_detector.get_cached_drives()
         active_tests = test_executor.get_all_progress()
         
         return jsonify({
@@ -644,6 +766,7 @@ def get_system_status():
                 'drives_detected': len(drives),
                 'active_tests': len(active_tests),
                 'os_drive': drive_detector.os_drive_name,
+                'database_pool': get_db().pool_status(),
                 'timestamp': datetime.now().isoformat()
             }
         })
@@ -664,17 +787,15 @@ def serve_frontend(path):
         return jsonify({'error': 'Not found'}), 404
     
     # Try to serve from React build directory (production)
-    if os.path.exists(FRONTEND_BUILD_DIR):
-        if path == '' or path == '/':
-            return send_file(os.path.join(FRONTEND_BUILD_DIR, 'index.html'))
-        
-        # Check if it's a static file
-        file_path = os.path.join(FRONTEND_BUILD_DIR, path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return send_file(file_path)
-        
-        # For React Router - serve index.html for all routes
-        return send_file(os.path.join(FRONTEND_BUILD_DIR, 'index.html'))
+    if FRONTEND_INDEX_HTML is not None:
+        # WhiteNoise already served any build file, so only look for one
+        # on disk when it isn't installed
+        if (path and not WHITENOISE_AVAILABLE
+                and os.path.isfile(os.path.join(FRONTEND_BUILD_DIR, path))):
+            return send_from_directory(FRONTEND_BUILD_DIR, path)
+        
+        # For React Router - serve index.html for / and all other routes
+        return Response(FRONTEND_INDEX_HTML, mimetype='text/html')
     
     # Development fallback - serve a simple message
     return '''
@@ -733,37 +854,86 @@ def serve_frontend(path):
 @socketio.on('connect')
 def handle_connect():
     """Handle WebSocket connection"""
-    print('Client connected')
+    logger.info('Client connected')
     emit('connected', {'message': 'Connected to HDD Tester'})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle WebSocket disconnection"""
-    print('Client disconnected')
+    logger.info('Client disconnected')
 
 
 # ============================================================================
 # Application Startup
 # ============================================================================
 
+def acquire_scan_lock() -> bool:
+    """
+    Try to become the single scanning worker on this host.
+    
+    The flock is held for the lifetime of the process, so it is released
+    automatically if the worker exits or is killed.
+    """
+    global scan_lock_handle
+    
+    if scan_lock_handle is not None:
+        return True
+    
+    # Opened without truncating: the file holds the current owner's PID
+    try:
+        fd = os.open(SCAN_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError as e:
+        # Without a usable lock file workers can't coordinate; scanning in
+        # each of them beats not scanning at all
+        logger.warning("Could not open scan lock %s (%s); scanning without it", SCAN_LOCK_FILE, e)
+        return True
+    
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    scan_lock_handle = fd
+    return True
+
+
 def initialize_app():
     """Initialize application on startup"""
-    global scanning_thread
+    global scanning_thread, progress_thread
+    
+    # Any process that runs tests needs to flush their progress
+    if progress_thread is None:
+        progress_thread = socketio.start_background_task(flush_test_progress)
+    
+    # REST-only processes leave scanning to the WebSocket process
+    if not RUN_SCANNER:
+        logger.info("Drive scanning disabled in this process (RUN_SCANNER=false)")
+        return
+    
+    # Under multiple workers only one of them runs the scan loop; the rest
+    # serve requests from the on-demand cache in DriveDetector
+    if scanning_thread is None and not acquire_scan_lock():
+        logger.info("Drive scanning already running in another worker (%s)", SCAN_LOCK_FILE)
+        return
     
     # Start background drive scanning if not already started
-    if scanning_thread is None or not scanning_thread.is_alive():
-        scanning_thread = threading.Thread(target=start_drive_scanning, daemon=True)
-        scanning_thread.start()
-        print("Drive scanning thread started")
+    if scanning_thread is None:
+        scanning_thread = socketio.start_background_task(start_drive_scanning)
+        logger.info("Drive scanning task started (%s mode)", SOCKETIO_ASYNC_MODE)
 
 
 if __name__ == '__main__':
-    print(f"Starting HDD Tester API on {HOST}:{PORT}")
-    print(f"Debug mode: {DEBUG}")
+    logger.info("Starting HDD Tester API on %s:%s", HOST, PORT)
+    logger.info("Debug mode: %s", DEBUG)
     
-    # Initialize drive scanning
-    initialize_app()
+    # With debug on, this first process is only the reloader's file watcher;
+    # the server (and so the scanner) runs in the child it spawns
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        initialize_app()
     
     # Run Flask-SocketIO app
     socketio.run(app, host=HOST, port=PORT, debug=DEBUG, allow_unsafe_werkzeug=True)
@@ -6,16 +6,22 @@ All settings and PO numbers persist across reboots.
 """
 
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float, ForeignKey, JSON, Index, Computed, func, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, deferred, Session
 from sqlalchemy.pool import QueuePool
-from typing import Optional
-from config import DATABASE_URL
+from typing import Iterator, Optional
+from config import DATABASE_URL, STRICT_ORM, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING
 
 Base = declarative_base()
 
+# Relationships must be loaded explicitly (selectinload) when STRICT_ORM is set
+RELATIONSHIP_LAZY = 'raise' if STRICT_ORM else 'select'
+
 
 class Drive(Base):
     """Drive information table"""
@@ -34,29 +40,33 @@ class Drive(Base):
     scsi_channel = Column(Integer)
     scsi_target = Column(Integer)
     scsi_lun = Column(Integer)
-    first_seen = Column(DateTime, default=datetime.now)
-    last_seen = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    first_seen = Column(DateTime, server_default=func.now())
+    last_seen = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
     
     # Relationships
-    test_sessions = relationship("TestSession", back_populates="drive")
+    test_sessions = relationship("TestSession", back_populates="drive", lazy=RELATIONSHIP_LAZY)
 
 
 class TestSession(Base):
     """Test session tracking"""
     __tablename__ = 'test_sessions'
+    __table_args__ = (
+        # Session history per drive; also serves the drive_serial foreign key
+        Index('ix_test_sessions_drive_status', 'drive_serial', 'status', 'start_time'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    drive_serial = Column(String(100), ForeignKey('drives.serial'), nullable=False, index=True)
+    drive_serial = Column(String(100), ForeignKey('drives.serial'), nullable=False)
     po_number = Column(String(100), index=True)
     user_session_id = Column(Integer, ForeignKey('user_sessions.id'), nullable=True)
-    start_time = Column(DateTime, default=datetime.now)
+    start_time = Column(DateTime, server_default=func.now())
     end_time = Column(DateTime, nullable=True)
     status = Column(String(50), default='running')  # 'running', 'completed', 'failed', 'cancelled'
     
     # Relationships
-    drive = relationship("Drive", back_populates="test_sessions")
-    user_session = relationship("UserSession", back_populates="test_sessions")
-    test_results = relationship("TestResult", back_populates="session")
+    drive = relationship("Drive", back_populates="test_sessions", lazy=RELATIONSHIP_LAZY)
+    user_session = relationship("UserSession", back_populates="test_sessions", lazy=RELATIONSHIP_LAZY)
+    test_results = relationship("TestResult", back_populates="session", lazy=RELATIONSHIP_LAZY)
 
 
 class TestResult(Base):
@@ -66,13 +76,14 @@ class TestResult(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(Integer, ForeignKey('test_sessions.id'), nullable=False, index=True)
     test_type = Column(String(50), nullable=False)  # 'smart', 'badblocks', 'format', etc.
-    result_data = Column(JSON)  # Store detailed results as JSON
-    timestamp = Column(DateTime, default=datetime.now)
+    # Detailed results as JSON; deferred so listing results only reads the narrow columns
+    result_data = deferred(Column(JSON))
+    timestamp = Column(DateTime, server_default=func.now())
     passed = Column(Boolean, default=True)
     error_message = Column(Text, nullable=True)
     
     # Relationships
-    session = relationship("TestSession", back_populates="test_results")
+    session = relationship("TestSession", back_populates="test_results", lazy=RELATIONSHIP_LAZY)
 
 
 class TestConfiguration(Base):
@@ -84,8 +95,16 @@ class TestConfiguration(Base):
     enabled_tests = Column(JSON)  # List of enabled test types
     test_parameters = Column(JSON)  # Test-specific parameters
     is_default = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    # 1 for the default configuration, NULL otherwise; the unique index allows
+    # a single default and turns the lookup into a unique-key hit
+    default_marker = Column(Integer, Computed('CASE WHEN is_default THEN 1 END'),
+                            unique=True, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
+
+
+# The backplane configuration is a single row with this primary key
+BACKPLANE_CONFIG_ID = 1
 
 
 class BackplaneConfig(Base):
@@ -97,22 +116,29 @@ class BackplaneConfig(Base):
     layout_type = Column(String(50), default='grid')  # 'grid', 'list', 'custom'
     layout_config = Column(JSON)  # Layout-specific configuration
     auto_detect = Column(Boolean, default=True)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
 
 
 class UserSession(Base):
     """User session tracking (PO numbers, etc.)"""
     __tablename__ = 'user_sessions'
+    __table_args__ = (
+        # Finds the active session without scanning old ones
+        Index('ix_user_sessions_active_last', 'is_active', 'last_activity'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     po_number = Column(String(100), index=True)
     user_name = Column(String(100), nullable=True)
-    created_at = Column(DateTime, default=datetime.now)
-    last_activity = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, server_default=func.now())
+    last_activity = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
     is_active = Column(Boolean, default=True)
+    # 1 for the active session, NULL otherwise (see TestConfiguration.default_marker)
+    active_marker = Column(Integer, Computed('CASE WHEN is_active THEN 1 END'),
+                           unique=True, index=True)
     
     # Relationships
-    test_sessions = relationship("TestSession", back_populates="user_session")
+    test_sessions = relationship("TestSession", back_populates="user_session", lazy=RELATIONSHIP_LAZY)
 
 
 class PersistentSetting(Base):
@@ -123,18 +149,22 @@ class PersistentSetting(Base):
     setting_key = Column(String(100), unique=True, nullable=False, index=True)
     setting_value = Column(Text)  # Can store JSON as text or simple values
     category = Column(String(50))  # 'ui', 'test', 'system', etc.
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
 
 
 class Log(Base):
     """System logs"""
     __tablename__ = 'logs'
+    __table_args__ = (
+        # Logs of one test session in time order
+        Index('ix_logs_session_ts', 'session_id', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(Integer, ForeignKey('test_sessions.id'), nullable=True)
     level = Column(String(20), nullable=False)  # 'INFO', 'WARNING', 'ERROR', 'DEBUG'
     message = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.now, index=True)
+    timestamp = Column(DateTime, server_default=func.now(), index=True)
 
 
 class Database:
@@ -144,24 +174,145 @@ class Database:
         self.engine = create_engine(
             database_url,
             poolclass=QueuePool,
-            pool_size=10,
-            max_overflow=20,
-            pool_pre_ping=True,  # Verify connections before using
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_pre_ping=DB_POOL_PRE_PING,  # Verify connections before using
+            pool_recycle=3600,  # Replace connections before MySQL's wait_timeout drops them
+            pool_use_lifo=True,  # Reuse the warmest connection; idle extras age out
+            # Multi-row INSERT batches: pymysql already folds executemany() INSERTs
+            # into one VALUES list, and this sizes SQLAlchemy's own batching
+            insertmanyvalues_page_size=1000,
+            query_cache_size=1200,  # Compiled statements kept per engine (default 500)
             echo=False  # Set to True for SQL debugging
         )
-        self.SessionLocal = sessionmaker(bind=self.engine, autocommit=False, autoflush=False)
+        # One session per thread (or green thread), reused across helper calls
+        self.SessionLocal = scoped_session(
+            # Helpers hand back ORM objects after their scope commits, so keep
+            # the loaded attributes instead of expiring them
+            sessionmaker(bind=self.engine, autocommit=False, autoflush=False,
+                         expire_on_commit=False)
+        )
     
     def create_tables(self):
         """Create all database tables"""
-        Base.metadata.create_all(self.engine)
+        # One connection and transaction for every table check and CREATE
+        # (MySQL still commits each DDL statement on its own)
+        with self.engine.begin() as conn:
+            Base.metadata.create_all(conn)
+        self.add_missing_columns()
+        self.create_missing_indexes()
+        self.sync_server_defaults()
+        self.migrate_backplane_config()
         print("Database tables created successfully")
     
+    def add_missing_columns(self):
+        """
+        Add generated columns declared on the models to tables that already exist.
+        
+        Only computed columns are handled: they need no backfill, since the
+        database derives their values from the existing rows.
+        """
+        inspector = inspect(self.engine)
+        existing_tables = set(inspector.get_table_names())
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.computed is not None and column.name not in existing:
+                        ddl = CreateColumn(column).compile(dialect=self.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+    
+    def create_missing_indexes(self):
+        """
+        Add indexes declared on the models to tables that already exist.
+        
+        create_all() skips existing tables, so databases created before an
+        index was added would otherwise never get it.
+        """
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(bind=self.engine, checkfirst=True)
+                except Exception as e:
+                    # e.g. a unique index over rows that already break it
+                    print(f"Warning: could not create index {index.name}: {e}")
+    
+    def sync_server_defaults(self):
+        """
+        Give timestamp columns of existing MySQL tables their DEFAULT CURRENT_TIMESTAMP.
+        
+        Tables created while timestamps were filled in by Python have no
+        database default, so rows inserted without one would get NULL.
+        Only columns still missing the default are altered, keeping their
+        nullability: MODIFY can rebuild the table, which is slow on logs
+        and test_results.
+        """
+        if self.engine.dialect.name != 'mysql':
+            return
+        inspector = inspect(self.engine)
+        existing_tables = set(inspector.get_table_names())
+        with self.engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing = {column['name']: column for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if not isinstance(column.type, DateTime) or column.server_default is None:
+                        continue
+                    reflected = existing.get(column.name)
+                    if reflected is None or reflected.get('default') is not None:
+                        continue
+                    null = 'NULL' if reflected['nullable'] else 'NOT NULL'
+                    conn.execute(text(
+                        f"ALTER TABLE `{table.name}` MODIFY `{column.name}` "
+                        f"DATETIME {null} DEFAULT CURRENT_TIMESTAMP"
+                    ))
+    
+    def migrate_backplane_config(self):
+        """
+        Move an existing backplane configuration row to BACKPLANE_CONFIG_ID.
+        
+        Older installs read the first row of the table, which need not have
+        that id; its lowest-id row is the one they were using.
+        """
+        with self.engine.begin() as conn:
+            if conn.execute(
+                text("SELECT 1 FROM backplane_config WHERE id = :id"),
+                {'id': BACKPLANE_CONFIG_ID}
+            ).first():
+                return
+            # MySQL can't UPDATE a table from a subquery on itself, so look the id up first
+            legacy_id = conn.execute(text("SELECT MIN(id) FROM backplane_config")).scalar()
+            if legacy_id is not None:
+                conn.execute(
+                    text("UPDATE backplane_config SET id = :id WHERE id = :legacy_id"),
+                    {'id': BACKPLANE_CONFIG_ID, 'legacy_id': legacy_id}
+                )
+    
+    def pool_status(self) -> dict:
+        """Connection pool usage, for health checks"""
+        pool = self.engine.pool
+        return {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': DB_MAX_OVERFLOW
+        }
+    
     def get_session(self) -> Session:
-        """Get a database session"""
+        """Get the database session for the current thread"""
         return self.SessionLocal()
     
+    def remove_session(self):
+        """Discard the current thread's session (call at end of request)"""
+        self.SessionLocal.remove()
+    
     def close(self):
         """Close database connections"""
+        self.SessionLocal.remove()
         self.engine.dispose()
 
 
@@ -177,6 +328,54 @@ def get_db() -> Database:
     return _db_instance
 
 
+# Session installed for the current request (or other unit of work), if any
+_current_session: ContextVar[Optional[Session]] = ContextVar('current_db_session', default=None)
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Provide a session for a block of database work.
+    
+    Inside a request (see bind_request_session) the request's session is
+    reused and left open for the request to release. Otherwise a session is
+    opened for the block, committed on success, rolled back on error and
+    closed afterwards.
+    """
+    ambient = _current_session.get()
+    if ambient is not None:
+        try:
+            yield ambient
+        except Exception:
+            # Leave the shared session usable for the rest of the request
+            ambient.rollback()
+            raise
+        return
+    
+    session = get_db().get_session()
+    token = _current_session.set(session)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        _current_session.reset(token)
+        session.close()
+
+
+def bind_request_session() -> Token:
+    """Install one session for the current request so all helpers share it"""
+    return _current_session.set(get_db().get_session())
+
+
+def release_request_session(token: Token):
+    """Undo bind_request_session and return the connection to the pool"""
+    _current_session.reset(token)
+    get_db().remove_session()
+
+
 def init_database():
     """Initialize database (create tables)"""
     db = get_db()
@@ -189,15 +388,12 @@ if __name__ == '__main__':
     init_database()
     print("Database initialized successfully!")
     
-    # Test connection
+    # Test connection (a bare connection; no Session needed for this)
     db = get_db()
-    session = db.get_session()
     try:
-        # Test query
-        result = session.execute("SELECT 1")
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
         print("Database connection test: SUCCESS")
     except Exception as e:
         print(f"Database connection test: FAILED - {e}")
-    finally:
-        session.close()
 
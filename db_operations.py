@@ -4,13 +4,269 @@ Database Operations Helper
 Convenience functions for common database operations.
 """
 
-from datetime import datetime
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 from database import (
-    get_db, Drive, TestSession, TestResult, TestConfiguration,
-    BackplaneConfig, UserSession, PersistentSetting, Log
+    session_scope, Drive, TestSession, TestResult, TestConfiguration,
+    BackplaneConfig, BACKPLANE_CONFIG_ID, UserSession, PersistentSetting, Log
 )
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.orm import Session
+from config import (
+    DB_BATCH_SIZE, DB_FLUSH_INTERVAL, SETTINGS_CACHE_TTL, ACTIVE_SESSION_CACHE_TTL,
+    LOG_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# Read Caches
+# ============================================================================
+
+_MISSING = object()
+
+
+class _TTLCache:
+    """Small thread-safe cache whose entries expire after ttl seconds"""
+    
+    def __init__(self, ttl: float, maxsize: int = 512):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Get a cached value, or _MISSING if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            return entry[1]
+    
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # Drop the entry closest to expiry to make room
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+    
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_settings_cache = _TTLCache(SETTINGS_CACHE_TTL)
+_active_session_cache = _TTLCache(ACTIVE_SESSION_CACHE_TTL, maxsize=1)
+
+
+# ============================================================================
+# Batched Inserts
+# ============================================================================
+
+# ORM bulk INSERT leaves None-valued keys out, which splits rows like
+# {'session_id': None} and {'session_id': 5} into separate executemany batches.
+# Rendering NULLs keeps a whole buffer in one batch; none of the buffered
+# columns has a server default that the NULL would override.
+_BULK_INSERT_OPTIONS = {'render_nulls': True}
+
+
+class _InsertBuffer:
+    """Rows waiting to be inserted into one table with a single executemany"""
+    
+    def __init__(self, model, max_pending: Optional[int] = None):
+        self.model = model
+        self.max_pending = max_pending  # oldest rows are dropped beyond this; None keeps all
+        self.rows: List[Dict] = []
+        self._lock = threading.Lock()
+    
+    def append(self, row: Dict) -> bool:
+        """Queue a row; returns True once a full batch is pending"""
+        with self._lock:
+            self.rows.append(row)
+            self._trim()
+            return len(self.rows) >= DB_BATCH_SIZE
+    
+    def _trim(self):
+        """Drop the oldest rows beyond max_pending (caller holds the lock)"""
+        if self.max_pending is None or len(self.rows) <= self.max_pending:
+            return
+        dropped = len(self.rows) - self.max_pending
+        del self.rows[:dropped]
+        logger.warning("Dropped %d buffered %s row(s) waiting for the database",
+                       dropped, self.model.__tablename__)
+    
+    def flush(self) -> int:
+        """Insert every pending row in one transaction"""
+        with self._lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        
+        try:
+            with session_scope() as session:
+                session.execute(insert(self.model), rows, execution_options=_BULK_INSERT_OPTIONS)
+                session.commit()
+            return len(rows)
+        except Exception:
+            # Keep the rows for the next flush, newest last
+            with self._lock:
+                self.rows = rows + self.rows
+                self._trim()
+            raise
+
+
+# Test results are never dropped; only log rows are capped while the
+# database is unreachable
+_result_buffer = _InsertBuffer(TestResult)
+_log_buffer = _InsertBuffer(Log, max_pending=DB_BATCH_SIZE * 10)
+_flush_thread: Optional[threading.Thread] = None
+_flush_thread_lock = threading.Lock()
+
+
+# How often the background loop applies LOG_RETENTION_DAYS
+LOG_PURGE_INTERVAL = 3600  # seconds
+
+
+def _flush_periodically():
+    """Background loop that writes buffered rows every DB_FLUSH_INTERVAL"""
+    next_purge = time.monotonic()
+    while True:
+        time.sleep(DB_FLUSH_INTERVAL)
+        try:
+            flush_pending_writes()
+        except Exception:
+            # The rows stay buffered and are retried on the next pass
+            logger.exception("Error flushing buffered database writes")
+        
+        if LOG_RETENTION_DAYS > 0 and time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + LOG_PURGE_INTERVAL
+            try:
+                purge_old_logs(LOG_RETENTION_DAYS)
+            except Exception:
+                logger.exception("Error purging old logs")
+
+
+def _ensure_flush_thread():
+    """Start the background flush loop on first use"""
+    global _flush_thread
+    if _flush_thread is not None:
+        return
+    with _flush_thread_lock:
+        if _flush_thread is None:
+            _flush_thread = threading.Thread(target=_flush_periodically, daemon=True)
+            _flush_thread.start()
+
+
+def flush_test_results() -> int:
+    """Write all buffered test results now"""
+    return _result_buffer.flush()
+
+
+def flush_logs() -> int:
+    """Write all buffered log entries now"""
+    return _log_buffer.flush()
+
+
+def flush_pending_writes():
+    """Write all buffered test results and log entries now"""
+    # Results first: logs may describe results that should already be visible
+    flush_test_results()
+    flush_logs()
+
+
+def _flush_at_exit():
+    """Best-effort flush so a clean shutdown doesn't drop buffered rows"""
+    try:
+        flush_pending_writes()
+    except Exception as e:
+        # Logging handlers may already be closing, so skip the traceback
+        logger.error("Error flushing buffered database writes at exit: %s", e)
+
+
+atexit.register(_flush_at_exit)
+
+
+# Statements for the hot lookups, built once so each call skips constructing
+# the query and goes straight to the engine's compiled-statement cache
+_STMT_DRIVE_BY_SERIAL = select(Drive).where(Drive.serial == bindparam('serial')).limit(1)
+_STMT_DRIVE_BY_BAY = select(Drive).where(Drive.bay_location == bindparam('bay_number')).limit(1)
+_STMT_ACTIVE_USER_SESSION = select(UserSession).where(UserSession.active_marker == 1)
+_STMT_SETTING_VALUE = select(PersistentSetting.setting_value).where(
+    PersistentSetting.setting_key == bindparam('setting_key')
+).limit(1)
+_STMT_DEFAULT_TEST_CONFIG = select(TestConfiguration).where(TestConfiguration.default_marker == 1)
+_STMT_TEST_CONFIG_BY_NAME = select(TestConfiguration).where(
+    TestConfiguration.name == bindparam('name')
+).limit(1)
+
+
+def _upsert(session: Session, model, values, key: str):
+    """
+    Insert rows, or update them in place where `key` already exists, in one statement.
+    
+    Uses INSERT ... ON DUPLICATE KEY UPDATE on MySQL and ON CONFLICT DO UPDATE
+    on SQLite/PostgreSQL, so concurrent writers can't race between a SELECT
+    and the INSERT. Other dialects fall back to selecting the existing keys,
+    then updating those rows and inserting the rest. Columns other than `key`
+    are overwritten with `values`.
+    
+    Args:
+        values: One row as a dict, or a list of rows that all have the same keys
+    """
+    dialect = session.get_bind().dialect.name
+    first_row = values[0] if isinstance(values, list) else values
+    update_keys = [column for column in first_row if column != key]
+    
+    if dialect == 'mysql':
+        stmt = mysql.insert(model).values(values)
+        stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_keys})
+    elif dialect in ('sqlite', 'postgresql'):
+        insert_fn = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert_fn(model).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: stmt.excluded[column] for column in update_keys}
+        )
+    else:
+        _upsert_fallback(session, model, values if isinstance(values, list) else [values],
+                         key, update_keys)
+        return
+    
+    session.execute(stmt)
+
+
+def _upsert_fallback(session: Session, model, rows: List[Dict], key: str,
+                     update_keys: List[str]):
+    """Select-then-write upsert for dialects without a native one"""
+    key_column = getattr(model, key)
+    existing = set(session.scalars(
+        select(key_column).where(key_column.in_([row[key] for row in rows]))
+    ))
+    
+    updates = [row for row in rows if row[key] in existing]
+    inserts = [row for row in rows if row[key] not in existing]
+    if updates and update_keys:
+        # bindparam names can't match column names in an executemany UPDATE
+        session.execute(
+            update(model.__table__)
+            .where(model.__table__.c[key] == bindparam('_key'))
+            .values({column: bindparam(f'_{column}') for column in update_keys}),
+            [{'_key': row[key], **{f'_{column}': row[column] for column in update_keys}}
+             for row in updates]
+        )
+    if inserts:
+        session.execute(insert(model), inserts)
 
 
 # ============================================================================
@@ -19,45 +275,70 @@ from sqlalchemy.orm import Session
 
 def get_or_create_drive(serial: str, **kwargs) -> Drive:
     """Get existing drive or create new one"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        drive = session.query(Drive).filter(Drive.serial == serial).first()
-        if not drive:
-            drive = Drive(serial=serial, **kwargs)
-            session.add(drive)
-            session.commit()
-            session.refresh(drive)
-        else:
-            # Update last_seen and other fields
-            drive.last_seen = datetime.now()
-            for key, value in kwargs.items():
-                if hasattr(drive, key):
-                    setattr(drive, key, value)
-            session.commit()
-        return drive
-    finally:
-        session.close()
+    # Unknown keyword arguments are ignored, as they always were on update
+    values = {key: value for key, value in kwargs.items() if key in Drive.__table__.c}
+    values.update(serial=serial, last_seen=datetime.now())
+    
+    with session_scope() as session:
+        _upsert(session, Drive, values, key='serial')
+        session.commit()
+        return session.scalars(
+            _STMT_DRIVE_BY_SERIAL, {'serial': serial},
+            execution_options={'populate_existing': True}
+        ).first()
+
+
+def bulk_upsert_drives(drive_infos: List) -> int:
+    """
+    Insert or update detected drives in a single transaction.
+    
+    Args:
+        drive_infos: DriveInfo objects from a scan (entries without a serial are skipped)
+    
+    Returns:
+        int: Number of drives written
+    """
+    now = datetime.now()
+    rows = {}
+    for info in drive_infos:
+        if not info.serial:
+            continue
+        rows[info.serial] = {
+            'serial': info.serial,
+            'model': info.model,
+            'capacity': info.capacity,
+            'connection_type': info.connection_type,
+            'sata_version': info.sata_version,
+            'bay_location': info.bay_number,
+            'device_path': info.device_path,
+            'stable_path': info.stable_path,
+            'scsi_host': info.scsi_host,
+            'scsi_channel': info.scsi_channel,
+            'scsi_target': info.scsi_target,
+            'scsi_lun': info.scsi_lun,
+            'last_seen': now
+        }
+    
+    if not rows:
+        return 0
+    
+    with session_scope() as session:
+        # One multi-row upsert; first_seen is only set for new drives
+        _upsert(session, Drive, list(rows.values()), key='serial')
+        session.commit()
+        return len(rows)
 
 
 def get_drive_by_serial(serial: str) -> Optional[Drive]:
     """Get drive by serial number"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(Drive).filter(Drive.serial == serial).first()
-    finally:
-        session.close()
+    with session_scope() as session:
+        return session.scalars(_STMT_DRIVE_BY_SERIAL, {'serial': serial}).first()
 
 
 def get_drive_by_bay(bay_number: int) -> Optional[Drive]:
     """Get drive by bay number"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(Drive).filter(Drive.bay_location == bay_number).first()
-    finally:
-        session.close()
+    with session_scope() as session:
+        return session.scalars(_STMT_DRIVE_BY_BAY, {'bay_number': bay_number}).first()
 
 
 # ============================================================================
@@ -67,49 +348,48 @@ def get_drive_by_bay(bay_number: int) -> Optional[Drive]:
 def get_or_create_active_session(po_number: Optional[str] = None, 
                                  user_name: Optional[str] = None) -> UserSession:
     """Get active user session or create new one"""
-    db = get_db()
-    session = db.get_session()
     try:
-        # Try to find active session
-        active_session = session.query(UserSession).filter(
-            UserSession.is_active == True
-        ).first()
-        
-        if active_session:
-            # Update PO number if provided
-            if po_number:
-                active_session.po_number = po_number
-            if user_name:
-                active_session.user_name = user_name
-            active_session.last_activity = datetime.now()
-            session.commit()
-            session.refresh(active_session)
-            return active_session
-        else:
-            # Create new session
-            new_session = UserSession(
-                po_number=po_number,
-                user_name=user_name,
-                is_active=True
-            )
-            session.add(new_session)
-            session.commit()
-            session.refresh(new_session)
-            return new_session
+        with session_scope() as session:
+            # Try to find active session
+            active_session = session.scalars(_STMT_ACTIVE_USER_SESSION).first()
+            
+            if active_session:
+                # Update PO number if provided
+                if po_number:
+                    active_session.po_number = po_number
+                if user_name:
+                    active_session.user_name = user_name
+                active_session.last_activity = datetime.now()
+                session.commit()
+                return active_session
+            else:
+                # Create new session; timestamps are set here so the returned
+                # object is complete without reading the row back
+                now = datetime.now()
+                new_session = UserSession(
+                    po_number=po_number,
+                    user_name=user_name,
+                    created_at=now,
+                    last_activity=now,
+                    is_active=True
+                )
+                session.add(new_session)
+                session.commit()
+                return new_session
     finally:
-        session.close()
+        # Dropped after the write so a concurrent read can't re-cache the old row
+        _active_session_cache.pop('active')
 
 
 def get_active_session() -> Optional[UserSession]:
-    """Get current active user session"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(UserSession).filter(
-            UserSession.is_active == True
-        ).first()
-    finally:
-        session.close()
+    """Get current active user session (cached for ACTIVE_SESSION_CACHE_TTL)"""
+    cached = _active_session_cache.get('active')
+    if cached is not _MISSING:
+        return cached
+    with session_scope() as session:
+        active_session = session.scalars(_STMT_ACTIVE_USER_SESSION).first()
+    _active_session_cache.set('active', active_session)
+    return active_session
 
 
 def update_po_number(po_number: str) -> UserSession:
@@ -125,9 +405,7 @@ def update_po_number(po_number: str) -> UserSession:
 def create_test_session(drive_serial: str, po_number: Optional[str] = None,
                        user_session_id: Optional[int] = None) -> TestSession:
     """Create a new test session"""
-    db = get_db()
-    session = db.get_session()
-    try:
+    with session_scope() as session:
         # Get or create user session if PO number provided
         if po_number and not user_session_id:
             user_session = get_or_create_active_session(po_number=po_number)
@@ -137,54 +415,46 @@ def create_test_session(drive_serial: str, po_number: Optional[str] = None,
             drive_serial=drive_serial,
             po_number=po_number,
             user_session_id=user_session_id,
+            start_time=datetime.now(),  # set here so no read-back is needed
             status='running'
         )
         session.add(test_session)
         session.commit()
-        session.refresh(test_session)
         return test_session
-    finally:
-        session.close()
 
 
 def update_test_session(session_id: int, status: str, 
                        end_time: Optional[datetime] = None):
     """Update test session status"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        test_session = session.query(TestSession).filter(
-            TestSession.id == session_id
-        ).first()
+    with session_scope() as session:
+        test_session = session.get(TestSession, session_id)
         if test_session:
             test_session.status = status
             if end_time:
                 test_session.end_time = end_time
             session.commit()
-    finally:
-        session.close()
 
 
 def add_test_result(session_id: int, test_type: str, passed: bool,
                    result_data: Optional[Dict] = None,
-                   error_message: Optional[str] = None) -> TestResult:
-    """Add a test result"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        test_result = TestResult(
-            session_id=session_id,
-            test_type=test_type,
-            passed=passed,
-            result_data=result_data,
-            error_message=error_message
-        )
-        session.add(test_result)
-        session.commit()
-        session.refresh(test_result)
-        return test_result
-    finally:
-        session.close()
+                   error_message: Optional[str] = None):
+    """
+    Queue a test result for insertion.
+    
+    Results are written in batches by flush_test_results(), which runs
+    once DB_BATCH_SIZE results are pending and every DB_FLUSH_INTERVAL.
+    """
+    _ensure_flush_thread()
+    full = _result_buffer.append({
+        'session_id': session_id,
+        'test_type': test_type,
+        'passed': passed,
+        'result_data': result_data,
+        'error_message': error_message,
+        'timestamp': datetime.now()
+    })
+    if full:
+        flush_test_results()
 
 
 # ============================================================================
@@ -192,60 +462,40 @@ def add_test_result(session_id: int, test_type: str, passed: bool,
 # ============================================================================
 
 def get_setting(setting_key: str, default: Optional[str] = None) -> Optional[str]:
-    """Get a persistent setting"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        setting = session.query(PersistentSetting).filter(
-            PersistentSetting.setting_key == setting_key
-        ).first()
-        return setting.setting_value if setting else default
-    finally:
-        session.close()
+    """Get a persistent setting (cached for SETTINGS_CACHE_TTL)"""
+    value = _settings_cache.get(setting_key)
+    if value is _MISSING:
+        with session_scope() as session:
+            row = session.execute(_STMT_SETTING_VALUE, {'setting_key': setting_key}).first()
+        # Missing keys are cached too, as None
+        value = row[0] if row else None
+        _settings_cache.set(setting_key, value)
+    return value if value is not None else default
 
 
 def set_setting(setting_key: str, setting_value: str, category: str = 'system'):
     """Set a persistent setting"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        setting = session.query(PersistentSetting).filter(
-            PersistentSetting.setting_key == setting_key
-        ).first()
-        
-        if setting:
-            setting.setting_value = setting_value
-            setting.category = category
-            setting.updated_at = datetime.now()
-        else:
-            setting = PersistentSetting(
-                setting_key=setting_key,
-                setting_value=setting_value,
-                category=category
-            )
-            session.add(setting)
-        
+    with session_scope() as session:
+        _upsert(session, PersistentSetting, {
+            'setting_key': setting_key,
+            'setting_value': setting_value,
+            'category': category,
+            'updated_at': datetime.now()
+        }, key='setting_key')
         session.commit()
-    finally:
-        session.close()
+    # Dropped after the write so a concurrent read can't re-cache the old value
+    _settings_cache.pop(setting_key)
 
 
 def get_all_settings(category: Optional[str] = None) -> Dict[str, str]:
     """Get all settings, optionally filtered by category"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        query = session.query(PersistentSetting)
-        if category:
-            query = query.filter(PersistentSetting.category == category)
-        
-        settings = {}
-        for setting in query.all():
-            settings[setting.setting_key] = setting.setting_value
-        
-        return settings
-    finally:
-        session.close()
+    # Only the two columns are selected, so rows come back as plain tuples
+    stmt = select(PersistentSetting.setting_key, PersistentSetting.setting_value)
+    if category:
+        stmt = stmt.where(PersistentSetting.category == category)
+    
+    with session_scope() as session:
+        return dict(session.execute(stmt).all())
 
 
 # ============================================================================
@@ -254,41 +504,25 @@ def get_all_settings(category: Optional[str] = None) -> Dict[str, str]:
 
 def get_default_test_config() -> Optional[TestConfiguration]:
     """Get default test configuration"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(TestConfiguration).filter(
-            TestConfiguration.is_default == True
-        ).first()
-    finally:
-        session.close()
+    with session_scope() as session:
+        return session.scalars(_STMT_DEFAULT_TEST_CONFIG).first()
 
 
 def get_test_config(name: str) -> Optional[TestConfiguration]:
     """Get test configuration by name"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(TestConfiguration).filter(
-            TestConfiguration.name == name
-        ).first()
-    finally:
-        session.close()
+    with session_scope() as session:
+        return session.scalars(_STMT_TEST_CONFIG_BY_NAME, {'name': name}).first()
 
 
 def save_test_config(name: str, enabled_tests: List[str],
                     test_parameters: Dict, is_default: bool = False):
     """Save test configuration"""
-    db = get_db()
-    session = db.get_session()
-    try:
+    with session_scope() as session:
         # If setting as default, unset other defaults
         if is_default:
-            session.query(TestConfiguration).update({TestConfiguration.is_default: False})
+            session.execute(update(TestConfiguration).values(is_default=False))
         
-        config = session.query(TestConfiguration).filter(
-            TestConfiguration.name == name
-        ).first()
+        config = session.scalars(_STMT_TEST_CONFIG_BY_NAME, {'name': name}).first()
         
         if config:
             config.enabled_tests = enabled_tests
@@ -305,8 +539,6 @@ def save_test_config(name: str, enabled_tests: List[str],
             session.add(config)
         
         session.commit()
-    finally:
-        session.close()
 
 
 # ============================================================================
@@ -315,41 +547,24 @@ def save_test_config(name: str, enabled_tests: List[str],
 
 def get_backplane_config() -> Optional[BackplaneConfig]:
     """Get backplane configuration"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        return session.query(BackplaneConfig).first()
-    finally:
-        session.close()
+    with session_scope() as session:
+        return session.get(BackplaneConfig, BACKPLANE_CONFIG_ID)
 
 
 def save_backplane_config(total_bays: int, layout_type: str = 'grid',
                          layout_config: Optional[Dict] = None,
                          auto_detect: bool = True):
     """Save backplane configuration"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        config = session.query(BackplaneConfig).first()
-        
-        if config:
-            config.total_bays = total_bays
-            config.layout_type = layout_type
-            config.layout_config = layout_config or {}
-            config.auto_detect = auto_detect
-            config.updated_at = datetime.now()
-        else:
-            config = BackplaneConfig(
-                total_bays=total_bays,
-                layout_type=layout_type,
-                layout_config=layout_config or {},
-                auto_detect=auto_detect
-            )
-            session.add(config)
-        
+    with session_scope() as session:
+        _upsert(session, BackplaneConfig, {
+            'id': BACKPLANE_CONFIG_ID,
+            'total_bays': total_bays,
+            'layout_type': layout_type,
+            'layout_config': layout_config or {},
+            'auto_detect': auto_detect,
+            'updated_at': datetime.now()
+        }, key='id')
         session.commit()
-    finally:
-        session.close()
 
 
 # ============================================================================
@@ -357,17 +572,42 @@ def save_backplane_config(total_bays: int, layout_type: str = 'grid',
 # ============================================================================
 
 def add_log(level: str, message: str, session_id: Optional[int] = None):
-    """Add a log entry"""
-    db = get_db()
-    session = db.get_session()
-    try:
-        log_entry = Log(
-            session_id=session_id,
-            level=level,
-            message=message
-        )
-        session.add(log_entry)
-        session.commit()
-    finally:
-        session.close()
-
+    """
+    Queue a log entry for insertion.
+    
+    Entries are written in batches by a background thread; if the database
+    is unreachable only the newest entries are kept.
+    """
+    _ensure_flush_thread()
+    full = _log_buffer.append({
+        'session_id': session_id,
+        'level': level,
+        'message': message,
+        'timestamp': datetime.now()
+    })
+    if full:
+        flush_logs()
+
+
+def purge_old_logs(retention_days: int = LOG_RETENTION_DAYS) -> int:
+    """
+    Delete log entries older than retention_days.
+    
+    Rows are removed in batches of DB_BATCH_SIZE so each transaction (and
+    the locks it holds) stays short even when a large backlog has built up.
+    
+    Returns:
+        int: Number of log entries deleted
+    """
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        with session_scope() as session:
+            ids = list(session.scalars(
+                select(Log.id).where(Log.timestamp < cutoff).limit(DB_BATCH_SIZE)
+            ))
+            if not ids:
+                return deleted
+            session.execute(delete(Log).where(Log.id.in_(ids)))
+            session.commit()
+        deleted += len(ids)
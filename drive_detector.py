@@ -6,14 +6,33 @@ Provides stable device path identification for persistent mapping.
 """
 
 import os
+import sys
+import hashlib
+import json
 import subprocess
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List
 from dataclasses import dataclass
 from os_drive_detector import get_os_drive, is_os_drive, get_all_non_os_drives
+from config import DRIVE_CACHE_MAX_AGE
 
+# `smartctl -i` lines carrying the serial and model ("Model Family" usually
+# comes first and wins, as it always has)
+_SMART_FIELD_RE = re.compile(
+    r'^(Serial [Nn]umber|Device Model|Model Number|Model Family):\s*([^:\n]*)', re.M
+)
+# SATA generation as printed by smartctl, e.g. "SATA 3.1" or "SATA/600"
+_SATA_VERSION_RE = re.compile(r'sata(?: ([123])|/(150|300|600))')
+_SATA_GENERATION = {'1': 1, '2': 2, '3': 3, '150': 1, '300': 2, '600': 3}
 
-@dataclass
+# __slots__ drops the per-instance __dict__; dataclass only generates them on 3.10+
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class DriveInfo:
     """Information about a detected drive"""
     device_name: str  # e.g., 'sdb'
@@ -29,6 +48,28 @@ class DriveInfo:
     scsi_channel: Optional[int] = None
     scsi_target: Optional[int] = None
     scsi_lun: Optional[int] = None
+    
+    @property
+    def scsi_path(self) -> Optional[str]:
+        """SCSI address as host:channel:target:lun, if known"""
+        if self.scsi_target is None:
+            return None
+        return f"{self.scsi_host}:{self.scsi_channel}:{self.scsi_target}:{self.scsi_lun}"
+    
+    def to_dict(self) -> Dict:
+        """JSON-ready representation used by the drive and bay APIs"""
+        return {
+            'device_path': self.device_path,
+            'device_name': self.device_name,
+            'serial': self.serial,
+            'model': self.model,
+            'capacity': self.capacity,
+            'connection_type': self.connection_type,
+            'sata_version': self.sata_version,
+            'bay_number': self.bay_number,
+            'stable_path': self.stable_path,
+            'scsi_path': self.scsi_path
+        }
 
 
 class DriveDetector:
@@ -38,35 +79,120 @@ class DriveDetector:
         self.os_drive_name, self.os_drive_path = get_os_drive()
         self.drives: Dict[str, DriveInfo] = {}
         self.bay_mapping: Dict[int, DriveInfo] = {}  # bay_number -> DriveInfo
+        self.serial_mapping: Dict[str, DriveInfo] = {}  # serial -> DriveInfo
+        self.fingerprint: Optional[str] = None  # Changes whenever the drive set changes
+        self.drives_json: List[Dict] = []  # API representation of self.drives, built once per scan
+        self.drives_etag: Optional[str] = None  # Digest of drives_json, changes with any field
+        
+        # device name -> /dev/disk/by-path link name, rebuilt at each scan
+        self._by_path_links: Optional[Dict[str, str]] = None
+        
+        # Latest scan snapshot: (monotonic timestamp, drives)
+        self._cache: tuple[float, Dict[str, DriveInfo]] = (0.0, {})
+        self._cache_lock = threading.RLock()
         
     def scan_drives(self) -> Dict[str, DriveInfo]:
         """
         Scan for all non-OS drives and extract their information.
         
+        The result also replaces the cached snapshot served by
+        get_cached_drives().
+        
         Returns:
             dict: Mapping of device_path -> DriveInfo
         """
-        self.drives = {}
-        self.bay_mapping = {}
+        drives: Dict[str, DriveInfo] = {}
+        bay_mapping: Dict[int, DriveInfo] = {}
         
         # Get all non-OS drives
         drive_paths = get_all_non_os_drives()
         
-        for device_path in drive_paths:
-            try:
-                drive_info = self._get_drive_info(device_path)
-                if drive_info:
-                    self.drives[device_path] = drive_info
-                    
-                    # Map to bay if bay number detected
-                    if drive_info.bay_number is not None:
-                        self.bay_mapping[drive_info.bay_number] = drive_info
-                        
-            except Exception as e:
-                print(f"Error scanning drive {device_path}: {e}")
-                continue
-        
-        return self.drives
+        # One pass over /dev/disk/by-path serves every probe in this scan
+        self._by_path_links = self._read_by_path_links()
+        
+        # Each probe is a handful of smartctl/udevadm calls, so run them side by
+        # side; map() keeps the results in drive_paths order
+        probes = []
+        if drive_paths:
+            with ThreadPoolExecutor(max_workers=min(32, len(drive_paths))) as pool:
+                probes = list(pool.map(self._probe_drive, drive_paths))
+        
+        for device_path, drive_info in zip(drive_paths, probes):
+            if drive_info:
+                drives[device_path] = drive_info
+                
+                # Map to bay if bay number detected
+                if drive_info.bay_number is not None:
+                    bay_mapping[drive_info.bay_number] = drive_info
+        
+        # Swap in the new results so readers never see a half-built scan
+        with self._cache_lock:
+            self.drives = drives
+            self.bay_mapping = bay_mapping
+            self.serial_mapping = {
+                info.serial: info for info in drives.values() if info.serial
+            }
+            self.fingerprint = self.compute_fingerprint(drives)
+            self.drives_json = [info.to_dict() for info in drives.values()]
+            self.drives_etag = self.compute_content_digest(self.drives_json)
+            self._cache = (time.monotonic(), drives)
+        
+        return drives
+    
+    def _probe_drive(self, device_path: str) -> Optional[DriveInfo]:
+        """Get drive info for one device, skipping it if the probe fails"""
+        try:
+            return self._get_drive_info(device_path)
+        except Exception as e:
+            print(f"Error scanning drive {device_path}: {e}")
+            return None
+    
+    @staticmethod
+    def compute_fingerprint(drives: Dict[str, DriveInfo]) -> str:
+        """Stable digest of which drive sits where (serial, bay, device path)"""
+        entries = sorted(
+            f"{info.serial}|{info.bay_number}|{info.device_path}" for info in drives.values()
+        )
+        return hashlib.sha1('\n'.join(entries).encode()).hexdigest()
+    
+    @staticmethod
+    def compute_content_digest(drives_json: List[Dict]) -> str:
+        """
+        Digest of every field in the serialized drive list.
+        
+        Unlike the fingerprint, this changes when a later probe fills in
+        a model, capacity or path that an earlier one missed.
+        """
+        encoded = json.dumps(drives_json, sort_keys=True, default=str)
+        return hashlib.sha1(encoded.encode()).hexdigest()
+    
+    def get_cached_drives_json(self) -> tuple[str, List[Dict]]:
+        """
+        Get the content digest and serialized drive list of the cached scan.
+        
+        Both values come from the same scan, so the digest can be used
+        as an ETag for the list.
+        """
+        with self._cache_lock:
+            self.get_cached_drives()
+            return self.drives_etag, self.drives_json
+    
+    def get_cached_drives(self, max_age: float = DRIVE_CACHE_MAX_AGE) -> Dict[str, DriveInfo]:
+        """
+        Get the latest scan results, rescanning only if they are stale.
+        
+        Args:
+            max_age: Maximum age in seconds of a reusable snapshot
+        
+        Returns:
+            dict: Mapping of device_path -> DriveInfo
+        """
+        with self._cache_lock:
+            timestamp, drives = self._cache
+            if time.monotonic() - timestamp < max_age:
+                return drives
+            # Holding the lock makes concurrent callers share one rescan
+            return self.scan_drives()
     
     def _get_drive_info(self, device_path: str) -> Optional[DriveInfo]:
         """Extract comprehensive information about a drive"""
@@ -97,38 +223,66 @@ class DriveDetector:
             if drive_info.scsi_target is not None:
                 drive_info.bay_number = drive_info.scsi_target
         
-        # Get drive metadata
-        drive_info.serial = self._get_serial(device_path)
-        drive_info.model = self._get_model(device_path)
+        # Get drive metadata (one smartctl -i run feeds all three parsers)
+        smart_info = self._get_smart_info(device_path)
+        smart_fields = self._parse_smart_fields(smart_info)
+        drive_info.serial = self._get_serial(device_path, smart_fields)
+        drive_info.model = self._get_model(device_path, smart_fields)
         drive_info.capacity = self._get_capacity(device_path)
         
         # Get connection type
-        drive_info.connection_type, drive_info.sata_version = self._get_connection_info(device_path)
+        drive_info.connection_type, drive_info.sata_version = self._get_connection_info(smart_info)
         
         return drive_info
     
+    @staticmethod
+    def _read_by_path_links() -> Dict[str, str]:
+        """Map each device name to the /dev/disk/by-path/ link pointing at it"""
+        links: Dict[str, str] = {}
+        try:
+            with os.scandir('/dev/disk/by-path') as entries:
+                for entry in entries:
+                    try:
+                        target = os.path.basename(os.readlink(entry.path))
+                    except OSError:
+                        continue
+                    # Partitions resolve to their own names (sdb1), so only whole-disk
+                    # links match a device; if several do, keep the first as before
+                    links.setdefault(target, entry.name)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading /dev/disk/by-path: {e}")
+        return links
+    
     def _get_stable_path(self, device_path: str) -> Optional[str]:
         """Get stable device path from /dev/disk/by-path/"""
         device_name = device_path.replace('/dev/', '')
         
+        if self._by_path_links is None:
+            self._by_path_links = self._read_by_path_links()
+        return self._by_path_links.get(device_name)
+    
+    @staticmethod
+    def _read_sysfs(path: str) -> Optional[str]:
+        """Read a sysfs attribute, or None if it doesn't exist or can't be read"""
         try:
-            by_path_dir = '/dev/disk/by-path'
-            if not os.path.exists(by_path_dir):
-                return None
-            
-            # Find symlink pointing to this device
-            for link_name in os.listdir(by_path_dir):
-                link_path = os.path.join(by_path_dir, link_name)
-                try:
-                    target = os.readlink(link_path)
-                    # Check if target matches our device (handle partition numbers)
-                    if device_name in target or f'/{device_name}' in target:
-                        return link_name
-                except Exception:
-                    continue
-        except Exception as e:
-            print(f"Error getting stable path for {device_path}: {e}")
-        
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _parse_scsi_address(scsi_str: str) -> Optional[Dict[str, int]]:
+        """Parse "host:channel:target:lun" (e.g. "0:0:5:0")"""
+        parts = scsi_str.split(':')
+        if len(parts) == 4 and all(part.isdigit() for part in parts):
+            return {
+                'host': int(parts[0]),
+                'channel': int(parts[1]),
+                'target': int(parts[2]),
+                'lun': int(parts[3])
+            }
         return None
     
     def _get_scsi_info(self, device_name: str) -> Optional[Dict[str, int]]:
@@ -136,105 +290,57 @@ class DriveDetector:
         scsi_device_path = f'/sys/block/{device_name}/device/scsi_device'
         
         try:
-            if os.path.exists(scsi_device_path):
-                # Check if it's a file or directory
-                if os.path.isfile(scsi_device_path):
-                    # Read from file
-                    with open(scsi_device_path, 'r') as f:
-                        scsi_str = f.read().strip()
-                        # Format: "0:0:5:0" -> host:channel:target:lun
-                        parts = scsi_str.split(':')
-                        if len(parts) == 4:
-                            return {
-                                'host': int(parts[0]),
-                                'channel': int(parts[1]),
-                                'target': int(parts[2]),
-                                'lun': int(parts[3])
-                            }
-                elif os.path.isdir(scsi_device_path):
-                    # It's a directory - try alternative methods
-                    # Method 1: Read from individual files in the directory
-                    host_path = os.path.join(scsi_device_path, 'host')
-                    channel_path = os.path.join(scsi_device_path, 'channel')
-                    target_path = os.path.join(scsi_device_path, 'target')
-                    lun_path = os.path.join(scsi_device_path, 'lun')
-                    
-                    scsi_info = {}
-                    if os.path.exists(host_path):
-                        with open(host_path, 'r') as f:
-                            scsi_info['host'] = int(f.read().strip())
-                    if os.path.exists(channel_path):
-                        with open(channel_path, 'r') as f:
-                            scsi_info['channel'] = int(f.read().strip())
-                    if os.path.exists(target_path):
-                        with open(target_path, 'r') as f:
-                            scsi_info['target'] = int(f.read().strip())
-                    if os.path.exists(lun_path):
-                        with open(lun_path, 'r') as f:
-                            scsi_info['lun'] = int(f.read().strip())
-                    
-                    if len(scsi_info) == 4:
-                        return scsi_info
-                    
-                    # Method 2: Use udevadm to get SCSI info
-                    device_path = f'/dev/{device_name}'
-                    result = subprocess.run(
-                        ['udevadm', 'info', '--query=property', '--name', device_path],
-                        capture_output=True,
-                        text=True,
-                        timeout=5
-                    )
-                    if result.returncode == 0:
-                        # Parse udevadm output for SCSI info
-                        for line in result.stdout.split('\n'):
-                            if 'ID_SCSI=' in line:
-                                # Format: ID_SCSI=1:0:0:0
-                                scsi_str = line.split('=')[1].strip()
-                                parts = scsi_str.split(':')
-                                if len(parts) == 4:
-                                    return {
-                                        'host': int(parts[0]),
-                                        'channel': int(parts[1]),
-                                        'target': int(parts[2]),
-                                        'lun': int(parts[3])
-                                    }
-        except Exception as e:
-            # Don't print error for directory case - it's expected on some systems
-            if 'Is a directory' not in str(e):
-                print(f"Error reading SCSI info for {device_name}: {e}")
+            # Usually a directory holding one entry named after the address
+            entries = os.listdir(scsi_device_path)
+        except FileNotFoundError:
+            return None
+        except NotADirectoryError:
+            # Read from file, format: "0:0:5:0" -> host:channel:target:lun
+            scsi_str = self._read_sysfs(scsi_device_path)
+            return self._parse_scsi_address(scsi_str) if scsi_str else None
+        except OSError as e:
+            print(f"Error reading SCSI info for {device_name}: {e}")
+            return None
         
-        return None
-    
-    def _get_serial(self, device_path: str) -> Optional[str]:
-        """Get drive serial number"""
         try:
+            for entry in entries:
+                scsi_info = self._parse_scsi_address(entry)
+                if scsi_info:
+                    return scsi_info
+            
+            # Read from individual files in the directory
+            scsi_info = {}
+            for key in ('host', 'channel', 'target', 'lun'):
+                value = self._read_sysfs(os.path.join(scsi_device_path, key))
+                if value is not None:
+                    scsi_info[key] = int(value)
+            
+            if len(scsi_info) == 4:
+                return scsi_info
+            
+            # Use udevadm to get SCSI info
+            device_path = f'/dev/{device_name}'
             result = subprocess.run(
-                ['smartctl', '-i', device_path],
+                ['udevadm', 'info', '--query=property', '--name', device_path],
                 capture_output=True,
                 text=True,
-                timeout=10
+                timeout=5
             )
             if result.returncode == 0:
+                # Parse udevadm output for SCSI info
                 for line in result.stdout.split('\n'):
-                    if 'Serial Number:' in line or 'Serial number:' in line:
-                        return line.split(':')[1].strip()
-        except Exception:
-            pass
-        
-        # Fallback: try sysfs
-        device_name = device_path.replace('/dev/', '')
-        serial_path = f'/sys/block/{device_name}/device/serial'
-        try:
-            if os.path.exists(serial_path):
-                with open(serial_path, 'r') as f:
-                    return f.read().strip()
-        except Exception:
-            pass
+                    if 'ID_SCSI=' in line:
+                        # Format: ID_SCSI=1:0:0:0
+                        scsi_info = self._parse_scsi_address(line.split('=')[1].strip())
+                        if scsi_info:
+                            return scsi_info
+        except Exception as e:
+            print(f"Error reading SCSI info for {device_name}: {e}")
         
         return None
     
-    def _get_model(self, device_path: str) -> Optional[str]:
-        """Get drive model number"""
+    def _get_smart_info(self, device_path: str) -> Optional[str]:
+        """Get `smartctl -i` output, or None if smartctl failed"""
         try:
             result = subprocess.run(
                 ['smartctl', '-i', device_path],
@@ -243,23 +349,39 @@ class DriveDetector:
                 timeout=10
             )
             if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'Device Model:' in line or 'Model Number:' in line or 'Model Family:' in line:
-                        return line.split(':')[1].strip()
+                return result.stdout
         except Exception:
             pass
         
+        return None
+    
+    @staticmethod
+    def _parse_smart_fields(smart_info: Optional[str]) -> Dict[str, str]:
+        """Pick serial and model out of `smartctl -i` output in one pass"""
+        fields: Dict[str, str] = {}
+        if smart_info:
+            for match in _SMART_FIELD_RE.finditer(smart_info):
+                key = 'serial' if match.group(1).startswith('Serial') else 'model'
+                fields.setdefault(key, match.group(2).strip())
+        return fields
+    
+    def _get_serial(self, device_path: str, smart_fields: Dict[str, str]) -> Optional[str]:
+        """Get drive serial number"""
+        if 'serial' in smart_fields:
+            return smart_fields['serial']
+        
         # Fallback: try sysfs
         device_name = device_path.replace('/dev/', '')
-        model_path = f'/sys/block/{device_name}/device/model'
-        try:
-            if os.path.exists(model_path):
-                with open(model_path, 'r') as f:
-                    return f.read().strip()
-        except Exception:
-            pass
+        return self._read_sysfs(f'/sys/block/{device_name}/device/serial')
+    
+    def _get_model(self, device_path: str, smart_fields: Dict[str, str]) -> Optional[str]:
+        """Get drive model number"""
+        if 'model' in smart_fields:
+            return smart_fields['model']
         
-        return None
+        # Fallback: try sysfs
+        device_name = device_path.replace('/dev/', '')
+        return self._read_sysfs(f'/sys/block/{device_name}/device/model')
     
     def _get_capacity(self, device_path: str) -> Optional[str]:
         """Get drive capacity"""
@@ -280,48 +402,51 @@ class DriveDetector:
         
         return None
     
-    def _get_connection_info(self, device_path: str) -> tuple[Optional[str], Optional[str]]:
+    def _get_connection_info(self, smart_info: Optional[str]) -> tuple[Optional[str], Optional[str]]:
         """Get connection type (SATA/SAS) and SATA version"""
         connection_type = None
         sata_version = None
         
-        try:
-            result = subprocess.run(
-                ['smartctl', '-i', device_path],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            if result.returncode == 0:
-                output = result.stdout.lower()
-                if 'sas' in output:
-                    connection_type = 'SAS'
-                elif 'sata' in output or 'ata' in output:
-                    connection_type = 'SATA'
-                    
-                    # Try to detect SATA version
-                    if 'sata 3' in output or 'sata/600' in output:
-                        sata_version = 'SATA3'
-                    elif 'sata 2' in output or 'sata/300' in output:
-                        sata_version = 'SATA2'
-                    elif 'sata 1' in output or 'sata/150' in output:
-                        sata_version = 'SATA1'
-        except Exception:
-            pass
+        if smart_info:
+            output = smart_info.lower()
+            if 'sas' in output:
+                connection_type = 'SAS'
+            elif 'sata' in output or 'ata' in output:
+                connection_type = 'SATA'
+                
+                # Try to detect SATA version (the newest one mentioned wins)
+                generations = [
+                    _SATA_GENERATION[number or speed]
+                    for number, speed in _SATA_VERSION_RE.findall(output)
+                ]
+                if generations:
+                    sata_version = f'SATA{max(generations)}'
         
         return connection_type, sata_version
     
+    def get_cached_bay_snapshot(self) -> tuple[Dict[str, DriveInfo], Dict[int, DriveInfo], str]:
+        """Get the cached drives, their bay index and content digest from the same scan"""
+        with self._cache_lock:
+            drives = self.get_cached_drives()
+            return drives, self.bay_mapping, self.drives_etag
+    
     def get_bay_map(self) -> Dict[int, DriveInfo]:
-        """Get mapping of bay numbers to drives"""
-        return self.bay_mapping
+        """Get mapping of bay numbers to drives from the cached scan"""
+        return self.get_cached_bay_snapshot()[1]
     
     def get_drive_by_bay(self, bay_number: int) -> Optional[DriveInfo]:
-        """Get drive information for a specific bay"""
-        return self.bay_mapping.get(bay_number)
+        """Get drive information for a specific bay from the cached scan"""
+        return self.get_bay_map().get(bay_number)
     
     def get_drive_by_path(self, device_path: str) -> Optional[DriveInfo]:
         """Get drive information by device path"""
         return self.drives.get(device_path)
+    
+    def get_drive_by_serial(self, serial: str) -> Optional[DriveInfo]:
+        """Get drive information by serial number from the cached scan"""
+        with self._cache_lock:
+            self.get_cached_drives()
+            return self.serial_mapping.get(serial)
 
 
 if __name__ == '__main__':
@@ -86,10 +86,17 @@ function App() {
     });
 
     socket.on('test_progress', (data) => {
+      // Progress arrives batched: latest update per drive, keyed by serial
+      const bySerial = {};
+      data.updates.forEach(update => {
+        bySerial[update.serial] = update;
+      });
+
       // Update test progress in bay map
       setBayMap(prev => prev.map(bay => {
-        if (bay.bay_number === data.bay_number) {
-          return { ...bay, test_progress: data };
+        const update = bySerial[bay.serial];
+        if (update) {
+          return { ...bay, test_progress: update };
         }
         return bay;
       }));
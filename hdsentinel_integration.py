@@ -6,12 +6,132 @@ Integrates actual HDSentinel Linux binary for comprehensive drive health testing
 
 import subprocess
 import os
+import sys
+import io
+import stat
 import json
 import re
+import selectors
+import threading
+import time
 import xml.etree.ElementTree as ET
-from typing import Dict, Optional, List
+from typing import Dict, Iterable, Optional, List, Union
 from pathlib import Path
 
+from config import DEBUG
+
+try:
+    import lxml.etree as LET
+    LXML_AVAILABLE = True
+    XML_PARSE_ERRORS = (LET.XMLSyntaxError, ET.ParseError)
+except ImportError:
+    LET = None
+    LXML_AVAILABLE = False
+    XML_PARSE_ERRORS = (ET.ParseError,)
+
+
+# Report fields, each matched over the whole report in one pass. Lookaheads
+# keep the old per-line conditions (e.g. a health line must mention "health")
+# and [^\S\n] stands for whitespace that doesn't cross into the next line.
+_HEALTH_RE = re.compile(r'^(?=[^\n]*health)[^\n]*?(\d+)%', re.IGNORECASE | re.MULTILINE)
+_TEMPERATURE_RE = re.compile(r'^(?=[^\n]*temp)[^\n]*?(\d+)[^\S\n]*°?c', re.IGNORECASE | re.MULTILINE)
+_POWER_ON_HOURS_RE = re.compile(
+    r'^(?=[^\n]*power)(?=[^\n]*hour)[^\n]*?(\d+)', re.IGNORECASE | re.MULTILINE
+)
+_MODEL_RE = re.compile(r'model(?::|[^\S\n])+(.+)', re.IGNORECASE)
+_SERIAL_RE = re.compile(r'serial(?::|[^\S\n])+(.+)', re.IGNORECASE)
+_CAPACITY_RE = re.compile(
+    r'^(?=[^\n]*(?:capacity|size))(?=[^\n]*\d+\.?\d*[^\S\n]*(?:gb|tb|mb))[^\n]*',
+    re.IGNORECASE | re.MULTILINE
+)
+_FIRST_NUMBER_RE = re.compile(r'(\d+)')
+
+# Surface test results, same whole-report approach as the health fields
+_BAD_SECTORS_RE = re.compile(
+    r'^(?=[^\n]*bad)(?=[^\n]*sector)[^\n]*?(\d+)', re.IGNORECASE | re.MULTILINE
+)
+_TESTED_SECTORS_RE = re.compile(r'^(?=[^\n]*(?:tested|scanned))[^\n]*?(\d+)', re.IGNORECASE | re.MULTILINE)
+_TEST_STATUS_RE = re.compile(r'^(?:(?=[^\n]*(passed))|(?=[^\n]*failed))', re.IGNORECASE | re.MULTILINE)
+# Start of each drive's section in a full-system text report
+_DEVICE_HEADER_RE = re.compile(r'^HDD Device\s+\d+\s*:\s*(/dev/\S+)', re.IGNORECASE | re.MULTILINE)
+# Drive list blocks and their "key: value" lines
+_BLANK_LINE_RE = re.compile(r'\n[^\S\n]*\n')
+_FIELD_LINE_RE = re.compile(r'^([^:\n]*):([^\n]*)$', re.MULTILINE)
+_DAYS_RE = re.compile(r'(\d+)\s*day', re.IGNORECASE)
+_HOURS_RE = re.compile(r'(\d+)\s*hour', re.IGNORECASE)
+
+# Health fields in HDSentinel XML reports -> element names that carry them
+# (names differ between HDSentinel versions; the first one with text wins)
+_XML_HEALTH_FIELDS = {
+    'health_percent': ('Health',),
+    'temperature': ('Current_Temperature', 'Temperature'),
+    'power_on_hours': ('Power_on_time', 'PowerOnTime'),
+    'model': ('Hard_Disk_Model_ID', 'Model'),
+    'serial': ('Hard_Disk_Serial_Number', 'Serial'),
+    'capacity': ('Total_Size', 'Capacity'),
+}
+# Elements naming the device a <Disk> entry describes
+_XML_DEVICE_TAGS = ('Hard_Disk_Device', 'Device')
+
+
+# Largest report kept from one HDSentinel run; -html or -completetest can
+# produce megabytes, and fan-out runs several at once
+MAX_OUTPUT_BYTES = 8 << 20
+
+
+def _run_capped(cmd: List[str], timeout: float, max_bytes: int = MAX_OUTPUT_BYTES) -> subprocess.CompletedProcess:
+    """
+    Run a command, keeping at most max_bytes of its stdout.
+    
+    stdout is read in 64 KiB chunks; past max_bytes the process is
+    terminated and the output truncated. stderr is discarded unless DEBUG
+    is on, in which case it goes to our own stderr.
+    
+    Raises:
+        subprocess.TimeoutExpired: If the command runs longer than timeout
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=None if DEBUG else subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    chunks = []
+    size = 0
+    with proc, selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                proc.kill()
+                raise subprocess.TimeoutExpired(cmd, timeout, output=b''.join(chunks))
+            if not selector.select(timeout=remaining):
+                continue
+            data = proc.stdout.read1(65536)
+            if not data:
+                break
+            chunks.append(data)
+            size += len(data)
+            if size >= max_bytes:
+                print(f"Output of {cmd[0]} exceeded {max_bytes} bytes; truncating")
+                proc.terminate()
+                break
+        return_code = proc.wait()
+    return subprocess.CompletedProcess(cmd, return_code, b''.join(chunks)[:max_bytes])
+
+
+def _decode_output(data: bytes) -> str:
+    """Decode captured HDSentinel output, replacing invalid UTF-8"""
+    return data.decode('utf-8', errors='replace')
+
+
+def _last_match(pattern: re.Pattern, text: str) -> Optional[re.Match]:
+    """Last match of pattern in text; later lines override earlier ones"""
+    match = None
+    for match in pattern.finditer(text):
+        pass
+    return match
+
 
 class HDSentinelIntegration:
     """
@@ -21,6 +141,12 @@ class HDSentinelIntegration:
     https://www.hdsentinel.com/hard_disk_sentinel_linux.php
     """
     
+    # Compiled once for all instances; one per tag, tried in _XML_HEALTH_FIELDS order
+    _XML_XPATHS = {
+        field: tuple(LET.XPath(f'(.//{tag})[1]/text()') for tag in tags)
+        for field, tags in _XML_HEALTH_FIELDS.items()
+    } if LXML_AVAILABLE else {}
+    
     def __init__(self, hdsentinel_path: Optional[str] = None):
         """
         Initialize HDSentinel integration.
@@ -31,6 +157,16 @@ class HDSentinelIntegration:
         self.hdsentinel_path = self._find_hdsentinel(hdsentinel_path)
         self.xml_output_path = None
         
+        # Parsed reports keyed by (device_path, return_code, hash(stdout)), so
+        # polling an unchanged drive skips re-parsing its report
+        self._parse_cache: Dict[tuple, Dict] = {}
+        self._parse_cache_lock = threading.Lock()
+        
+        # (monotonic timestamp, {device_path: health dict}) from the last
+        # full-system report; the lock keeps concurrent callers to one scan
+        self._scan_cache: Optional[tuple] = None
+        self._scan_lock = threading.Lock()
+        
         if not self.hdsentinel_path:
             raise FileNotFoundError(
                 "HDSentinel binary not found. "
@@ -70,57 +206,223 @@ class HDSentinelIntegration:
             './HDSENTINEL',
         ]
         
+        # Stat each distinct location once; relative and absolute spellings
+        # of the same place are collapsed
+        for path in dict.fromkeys(map(os.path.abspath, search_paths)):
+            if self._is_executable_file(path):
+                return path
+        
         # Check for binary files inside folders
-        for folder_path in folder_paths:
-            if os.path.isdir(folder_path):
-                # Check common binary names inside folder
-                for bin_name in ['hdsentinel', 'HDSentinel', 'HDSENTINEL', 'hdsentinel-linux', 'HDSentinel-linux']:
+        bin_names = ['hdsentinel', 'HDSentinel', 'HDSENTINEL', 'hdsentinel-linux', 'HDSentinel-linux']
+        for folder_path in dict.fromkeys(map(os.path.abspath, folder_paths)):
+            try:
+                with os.scandir(folder_path) as entries:
+                    present = {entry.name for entry in entries}
+            except OSError:
+                continue
+            for bin_name in bin_names:
+                if bin_name in present:
                     bin_path = os.path.join(folder_path, bin_name)
-                    if os.path.exists(bin_path) and os.access(bin_path, os.X_OK):
-                        search_paths.append(bin_path)
-        
-        for path in search_paths:
-            if os.path.exists(path) and os.access(path, os.X_OK):
-                return path
+                    if self._is_executable_file(bin_path):
+                        return bin_path
         
         return None
     
-    def check_health(self, device_path: str) -> Dict:
+    @staticmethod
+    def _is_executable_file(path: str) -> bool:
+        """Regular file with an execute bit, checked with a single stat"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return stat.S_ISREG(st.st_mode) and bool(st.st_mode & 0o111)
+    
+    def check_health(self, device_path: str, force_refresh: bool = False) -> Dict:
         """
         Run HDSentinel health check on a drive.
         
+        Served from the full-system scan when a multi-drive sweep has just
+        run one (see scan_all) and it covers the drive; otherwise HDSentinel
+        is run for this drive alone. A single check never starts a full scan.
+        
         Args:
             device_path: Path to device (e.g., '/dev/sdb')
+            force_refresh: Drop the shared scan and query the drive directly
         
         Returns:
             Dictionary with health information
         """
+        if force_refresh:
+            self._scan_cache = None
+        else:
+            health_data = self._fresh_scan().get(device_path)
+            if health_data is not None:
+                return dict(health_data)
+        
         # HDSentinel command-line options vary by version
         # Common options: -r (report), -html (HTML output), -txt (text output)
         
-        # Try to get text report
-        result = subprocess.run(
+        # Prefer the XML report: fields come from named elements rather than
+        # scraping text
+        result = _run_capped(
+            [self.hdsentinel_path, '-xml', device_path],
+            timeout=60
+        )
+        if result.returncode == 0 and result.stdout.lstrip().startswith(b'<'):
+            try:
+                health_data = dict(self._parse_cached(
+                    device_path, result.returncode, result.stdout, xml=True
+                ))
+            except XML_PARSE_ERRORS:
+                health_data = None
+            if health_data:
+                health_data['raw_output'] = _decode_output(result.stdout)
+                health_data['return_code'] = result.returncode
+                return health_data
+        
+        # Fall back to the text report
+        result = _run_capped(
             [self.hdsentinel_path, '-r', device_path],
-            capture_output=True,
-            text=True,
             timeout=60
         )
         
         if result.returncode != 0:
             # Try alternative command format
-            result = subprocess.run(
+            result = _run_capped(
                 [self.hdsentinel_path, device_path],
-                capture_output=True,
-                text=True,
                 timeout=60
             )
         
-        health_data = self._parse_hdsentinel_output(result.stdout)
-        health_data['raw_output'] = result.stdout
+        output = _decode_output(result.stdout)
+        health_data = dict(self._parse_cached(device_path, result.returncode, output))
+        health_data['raw_output'] = output
         health_data['return_code'] = result.returncode
         
         return health_data
     
+    def _fresh_scan(self, ttl_seconds: float = 10) -> Dict[str, Dict]:
+        """The last full-system scan if it is still fresh, else empty; never scans"""
+        cached = self._scan_cache
+        if cached and time.monotonic() - cached[0] < ttl_seconds:
+            return cached[1]
+        return {}
+    
+    def scan_all(self, ttl_seconds: float = 10, force_refresh: bool = False) -> Dict[str, Dict]:
+        """
+        Health of every drive HDSentinel sees, from one full-system report.
+        
+        For multi-drive sweeps: one HDSentinel run replaces a process per
+        drive, and check_health answers from the result for ttl_seconds.
+        
+        Args:
+            ttl_seconds: How long a scan stays fresh
+            force_refresh: Rescan even if the last scan is still fresh
+        
+        Returns:
+            Dictionary of device_path -> health information
+        """
+        with self._scan_lock:
+            cached = self._scan_cache
+            if not force_refresh and cached and time.monotonic() - cached[0] < ttl_seconds:
+                return cached[1]
+            
+            try:
+                # Prefer the XML report, split per <Disk>; the text report's
+                # fields are scraped and can be misread
+                by_device = self._scan_all_xml()
+                if not by_device:
+                    result = _run_capped(
+                        [self.hdsentinel_path, '-r'],
+                        timeout=60
+                    )
+                    by_device = self._split_report_by_device(_decode_output(result.stdout))
+                    for device_path, section in by_device.items():
+                        health_data = dict(self._parse_cached(device_path, result.returncode, section))
+                        health_data['raw_output'] = section
+                        health_data['return_code'] = result.returncode
+                        by_device[device_path] = health_data
+            except (subprocess.TimeoutExpired, OSError) as e:
+                print(f"Error scanning drives with HDSentinel: {e}")
+                by_device = {}
+            
+            # Failed scans are remembered too, so callers fall back to
+            # per-drive checks instead of retrying the full scan each time
+            self._scan_cache = (time.monotonic(), by_device)
+            return by_device
+    
+    def _scan_all_xml(self) -> Dict[str, Dict]:
+        """
+        Health of every drive from one full-system XML report, keyed by device path.
+        
+        Empty when the XML report is unavailable or names no devices, so the
+        caller falls back to the text report.
+        """
+        result = _run_capped(
+            [self.hdsentinel_path, '-xml'],
+            timeout=60
+        )
+        if result.returncode != 0 or not result.stdout.lstrip().startswith(b'<'):
+            return {}
+        try:
+            root = LET.fromstring(result.stdout) if LXML_AVAILABLE else ET.fromstring(result.stdout)
+        except XML_PARSE_ERRORS:
+            return {}
+        
+        tostring = LET.tostring if LXML_AVAILABLE else ET.tostring
+        device_paths = filter(None, map(self._xml_disk_device, root.iter('Disk')))
+        by_device = {}
+        for device_path in dict.fromkeys(device_paths):
+            # The same lookup check_health's per-drive XML path uses
+            disk = self._find_xml_disk(root, device_path)
+            health_data = self._xml_disk_health(disk) if disk is not None else {}
+            if health_data:
+                health_data['raw_output'] = _decode_output(tostring(disk))
+                health_data['return_code'] = result.returncode
+                by_device[device_path] = health_data
+        return by_device
+    
+    @staticmethod
+    def _xml_disk_device(disk) -> Optional[str]:
+        """Device path a <Disk> element names (e.g. '/dev/sdb'), or None"""
+        for tag in _XML_DEVICE_TAGS:
+            text = (disk.findtext(f'.//{tag}') or '').strip()
+            if text.startswith('/dev/'):
+                return text.split()[0]
+        disk_id = (disk.get('id') or '').strip()
+        if disk_id.startswith('/dev/'):
+            return disk_id
+        return None
+    
+    @staticmethod
+    def _split_report_by_device(output: str) -> Dict[str, str]:
+        """Split a full-system text report into {device_path: that drive's section}"""
+        headers = list(_DEVICE_HEADER_RE.finditer(output))
+        sections = {}
+        for i, header in enumerate(headers):
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(output)
+            sections[header.group(1)] = output[header.start():end]
+        return sections
+    
+    def _parse_cached(self, device_path: str, return_code: int, output: Union[str, bytes],
+                      xml: bool = False) -> Dict:
+        """Parse a health report, reusing the result for an identical report"""
+        key = (device_path, return_code, hash(output), xml)
+        with self._parse_cache_lock:
+            cached = self._parse_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        if xml:
+            parsed = self._parse_xml_health(output, device_path)
+        else:
+            parsed = self._parse_hdsentinel_output(output)
+        with self._parse_cache_lock:
+            # Reports change as counters tick, so keep only recent ones
+            if len(self._parse_cache) >= 256:
+                self._parse_cache.clear()
+            self._parse_cache[key] = parsed
+        return parsed
+    
     def get_detailed_report(self, device_path: str, output_format: str = 'txt') -> Dict:
         """
         Get detailed HDSentinel report.
@@ -140,24 +442,22 @@ class HDSentinelIntegration:
         
         flag = format_flags.get(output_format, '-txt')
         
-        result = subprocess.run(
+        result = _run_capped(
             [self.hdsentinel_path, flag, device_path],
-            capture_output=True,
-            text=True,
             timeout=120
         )
         
         report_data = {
             'format': output_format,
-            'output': result.stdout,
+            'output': _decode_output(result.stdout),
             'return_code': result.returncode
         }
         
         if output_format == 'xml' and result.returncode == 0:
             try:
-                root = ET.fromstring(result.stdout)
-                report_data['parsed'] = self._parse_xml_report(root)
-            except ET.ParseError:
+                disks = self._iter_xml_disks(result.stdout)
+                report_data['parsed'] = self._parse_xml_report(disks)
+            except XML_PARSE_ERRORS:
                 report_data['parse_error'] = 'Failed to parse XML'
         
         return report_data
@@ -181,18 +481,17 @@ class HDSentinelIntegration:
         
         flag = test_flags.get(test_type, '-quicktest')
         
-        result = subprocess.run(
+        result = _run_capped(
             [self.hdsentinel_path, flag, device_path],
-            capture_output=True,
-            text=True,
             timeout=3600  # 1 hour max
         )
         
+        output = _decode_output(result.stdout)
         return {
             'test_type': test_type,
-            'output': result.stdout,
+            'output': output,
             'return_code': result.returncode,
-            'results': self._parse_test_results(result.stdout)
+            'results': self._parse_test_results(output)
         }
     
     def get_all_drives_info(self) -> List[Dict]:
@@ -202,23 +501,19 @@ class HDSentinelIntegration:
         Returns:
             List of drive information dictionaries
         """
-        result = subprocess.run(
+        result = _run_capped(
             [self.hdsentinel_path, '-r'],
-            capture_output=True,
-            text=True,
             timeout=60
         )
         
         if result.returncode != 0:
             # Try without flag
-            result = subprocess.run(
+            result = _run_capped(
                 [self.hdsentinel_path],
-                capture_output=True,
-                text=True,
                 timeout=60
             )
         
-        return self._parse_drive_list(result.stdout)
+        return self._parse_drive_list(_decode_output(result.stdout))
     
     def _parse_hdsentinel_output(self, output: str) -> Dict:
         """Parse HDSentinel text output"""
@@ -236,63 +531,139 @@ class HDSentinelIntegration:
             'capacity': None,
         }
         
-        lines = output.split('\n')
-        for line in lines:
-            line_lower = line.lower()
-            
-            # Health percentage
-            if 'health' in line_lower and '%' in line:
-                try:
-                    health_match = re.search(r'(\d+)%', line)
-                    if health_match:
-                        health_data['health_percent'] = int(health_match.group(1))
-                except:
-                    pass
-            
-            # Temperature
-            if 'temperature' in line_lower or 'temp' in line_lower:
-                try:
-                    temp_match = re.search(r'(\d+)\s*°?c', line, re.IGNORECASE)
-                    if temp_match:
-                        health_data['temperature'] = int(temp_match.group(1))
-                except:
-                    pass
-            
-            # Power-on hours
-            if 'power' in line_lower and 'hour' in line_lower:
-                try:
-                    poh_match = re.search(r'(\d+)', line)
-                    if poh_match:
-                        health_data['power_on_hours'] = int(poh_match.group(1))
-                except:
-                    pass
-            
-            # Model
-            if 'model' in line_lower:
-                model_match = re.search(r'model[:\s]+(.+)', line, re.IGNORECASE)
-                if model_match:
-                    health_data['model'] = model_match.group(1).strip()
-            
-            # Serial
-            if 'serial' in line_lower:
-                serial_match = re.search(r'serial[:\s]+(.+)', line, re.IGNORECASE)
-                if serial_match:
-                    health_data['serial'] = serial_match.group(1).strip()
-            
-            # Capacity
-            if 'capacity' in line_lower or 'size' in line_lower:
-                cap_match = re.search(r'(\d+\.?\d*)\s*(gb|tb|mb)', line, re.IGNORECASE)
-                if cap_match:
-                    health_data['capacity'] = line.strip()
+        match = _last_match(_HEALTH_RE, output)
+        if match:
+            health_data['health_percent'] = int(match.group(1))
+        
+        match = _last_match(_TEMPERATURE_RE, output)
+        if match:
+            health_data['temperature'] = int(match.group(1))
+        
+        match = _last_match(_POWER_ON_HOURS_RE, output)
+        if match:
+            health_data['power_on_hours'] = int(match.group(1))
+        
+        match = _last_match(_MODEL_RE, output)
+        if match:
+            health_data['model'] = match.group(1).strip()
+        
+        match = _last_match(_SERIAL_RE, output)
+        if match:
+            health_data['serial'] = match.group(1).strip()
+        
+        match = _last_match(_CAPACITY_RE, output)
+        if match:
+            health_data['capacity'] = match.group(0).strip()
         
         return health_data
     
-    def _parse_xml_report(self, root: ET.Element) -> Dict:
-        """Parse HDSentinel XML report"""
+    @staticmethod
+    def _iter_xml_disks(xml_data: bytes) -> Iterable:
+        """
+        Stream <Disk> elements out of an XML report.
+        
+        Each element is cleared once the caller moves on, so multi-drive
+        reports never sit in memory as a full tree.
+        """
+        if LXML_AVAILABLE:
+            for _, elem in LET.iterparse(io.BytesIO(xml_data), events=('end',), tag='Disk'):
+                yield elem
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        else:
+            for _, elem in ET.iterparse(io.BytesIO(xml_data), events=('end',)):
+                if elem.tag == 'Disk':
+                    yield elem
+                    elem.clear()
+    
+    @staticmethod
+    def _find_xml_disk(root, device_path: str):
+        """
+        The <Disk> element of an XML report that describes device_path, or None.
+        
+        A report without <Disk> elements is treated as a single disk.
+        """
+        names = {device_path, os.path.basename(device_path)}
+        disks = list(root.iter('Disk')) or [root]
+        for disk in disks:
+            if disk.get('id') in names:
+                return disk
+            for tag in _XML_DEVICE_TAGS:
+                text = disk.findtext(f'.//{tag}')
+                if text and text.strip() in names:
+                    return disk
+        return None
+    
+    def _parse_xml_health(self, output: bytes, device_path: str) -> Dict:
+        """
+        Parse the health fields of device_path's entry in an HDSentinel XML report.
+        
+        Returns the same keys as _parse_hdsentinel_output, or an empty dict
+        when no entry matches the device or it has none of the known elements.
+        
+        Raises:
+            XML_PARSE_ERRORS: If the output is not well-formed XML
+        """
+        root = LET.fromstring(output) if LXML_AVAILABLE else ET.fromstring(output)
+        disk = self._find_xml_disk(root, device_path)
+        if disk is None:
+            return {}
+        return self._xml_disk_health(disk)
+    
+    def _xml_disk_health(self, disk) -> Dict:
+        """Health fields of one <Disk> element; empty if it has none of the known elements"""
+        values = {}
+        for field, tags in _XML_HEALTH_FIELDS.items():
+            if LXML_AVAILABLE:
+                texts = (next(iter(xpath(disk)), None) for xpath in self._XML_XPATHS[field])
+            else:
+                texts = (disk.findtext(f'.//{tag}') for tag in tags)
+            values[field] = next((text.strip() for text in texts if text and text.strip()), None)
+        
+        if not any(values.values()):
+            return {}
+        
+        health_data = {
+            'health_percent': None,
+            'temperature': None,
+            'power_on_hours': None,
+            'power_cycle_count': None,
+            'reallocated_sectors': None,
+            'pending_sectors': None,
+            'uncorrectable_sectors': None,
+            'status': None,
+            'model': values['model'],
+            'serial': values['serial'],
+            'capacity': values['capacity'],
+        }
+        for field in ('health_percent', 'temperature'):
+            match = _FIRST_NUMBER_RE.search(values[field] or '')
+            if match:
+                health_data[field] = int(match.group(1))
+        
+        # Power on time reads like "1234 days, 5 hours"
+        power_on = values['power_on_hours'] or ''
+        days = _DAYS_RE.search(power_on)
+        hours = _HOURS_RE.search(power_on)
+        if days or hours:
+            health_data['power_on_hours'] = (
+                (int(days.group(1)) * 24 if days else 0) + (int(hours.group(1)) if hours else 0)
+            )
+        else:
+            match = _FIRST_NUMBER_RE.search(power_on)
+            if match:
+                health_data['power_on_hours'] = int(match.group(1))
+        
+        return health_data
+    
+    def _parse_xml_report(self, root) -> Dict:
+        """Parse HDSentinel XML report from a root element or streamed <Disk> elements"""
         data = {}
         
         # Navigate XML structure (structure may vary by HDSentinel version)
-        for disk in root.findall('.//Disk'):
+        disks = root.iterfind('.//Disk') if hasattr(root, 'iterfind') else root
+        for disk in disks:
             disk_data = {}
             for child in disk:
                 disk_data[child.tag] = child.text
@@ -308,45 +679,33 @@ class HDSentinelIntegration:
             'status': 'unknown'
         }
         
-        lines = output.split('\n')
-        for line in lines:
-            if 'bad' in line.lower() and 'sector' in line.lower():
-                bad_match = re.search(r'(\d+)', line)
-                if bad_match:
-                    results['bad_sectors'] = int(bad_match.group(1))
-            
-            if 'tested' in line.lower() or 'scanned' in line.lower():
-                tested_match = re.search(r'(\d+)', line)
-                if tested_match:
-                    results['tested_sectors'] = int(tested_match.group(1))
-            
-            if 'passed' in line.lower():
-                results['status'] = 'passed'
-            elif 'failed' in line.lower():
-                results['status'] = 'failed'
+        match = _last_match(_BAD_SECTORS_RE, output)
+        if match:
+            results['bad_sectors'] = int(match.group(1))
+        
+        match = _last_match(_TESTED_SECTORS_RE, output)
+        if match:
+            results['tested_sectors'] = int(match.group(1))
+        
+        # The last line mentioning either word decides; 'passed' wins on a
+        # line that has both
+        match = _last_match(_TEST_STATUS_RE, output)
+        if match:
+            results['status'] = 'passed' if match.group(1) else 'failed'
         
         return results
     
     def _parse_drive_list(self, output: str) -> List[Dict]:
         """Parse list of all drives"""
         drives = []
-        lines = output.split('\n')
-        
-        current_drive = {}
-        for line in lines:
-            if not line.strip():
-                if current_drive:
-                    drives.append(current_drive)
-                    current_drive = {}
-                continue
-            
-            # Parse drive information
-            if ':' in line:
-                key, value = line.split(':', 1)
-                current_drive[key.strip().lower()] = value.strip()
         
-        if current_drive:
-            drives.append(current_drive)
+        # Blank lines separate drives; within a block every "key: value" line
+        # is a field (keys are shared by all drives, so intern them)
+        for block in _BLANK_LINE_RE.split(output):
+            current_drive = {}
+            for match in _FIELD_LINE_RE.finditer(block):
+                current_drive[sys.intern(match.group(1).strip().lower())] = match.group(2).strip()
+            if current_drive:
+                drives.append(current_drive)
         
         return drives
-
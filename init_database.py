@@ -18,12 +18,11 @@ def main():
         # Initialize database (creates tables)
         init_database()
         
-        # Test connection
+        # Test connection on a bare connection; the ORM session isn't needed
         db = get_db()
-        session = db.get_session()
         try:
-            from sqlalchemy import text
-            result = session.execute(text("SELECT 1"))
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
             print("\n✓ Database connection successful!")
             print("✓ Tables created/verified successfully!")
             return 0
@@ -35,8 +34,6 @@ def main():
             print("  3. User 'newinv' has proper permissions")
             print("  4. Network connectivity to database server")
             return 1
-        finally:
-            session.close()
             
     except Exception as e:
         print(f"\n✗ Database initialization failed: {e}")
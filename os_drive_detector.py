@@ -7,13 +7,114 @@ be used before any destructive operations.
 """
 
 import os
+import json
 import subprocess
 import re
 from pathlib import Path
 from typing import Optional, Set
 
+from config import OS_DRIVE_OVERRIDE
+
+
+# OS drive found by the first successful detection; the root device can't
+# change while the system is running
+_os_drive: Optional[tuple[str, str]] = None
+
+# Names of every disk holding the root or /boot filesystem, including the OS
+# drive itself; more than one when those sit on a RAID mirror or an LVM
+# volume group spanning several disks
+_os_drive_members: frozenset = frozenset()
+
+# NVMe and SD/eMMC partitions carry a 'p' before the number (nvme0n1p1,
+# mmcblk0p1); the trailing digits of nvme0n1 or mmcblk0 are the disk's own
+_P_PARTITION = re.compile(r'((?:nvme\d+n|mmcblk)\d+)p\d+$')
+
+# Name prefixes of disks the OS can boot from: SCSI/SATA, NVMe, IDE,
+# virtio, Xen and SD/eMMC
+_VALID_PREFIXES = ('sd', 'nvme', 'hd', 'vd', 'xvd', 'mmcblk')
+
+# Deepest stack of holders followed from a mounted device to a disk
+# (e.g. LVM on dm-crypt on RAID on a partition)
+_MAX_HOLDER_DEPTH = 8
+
+# First mounts/fstab line whose mount point is '/'; the source may not start
+# with '#' so commented-out fstab entries are skipped
+_ROOT_MOUNT_RE = re.compile(rb'(?m)^[ \t]*([^#\s]\S*)[ \t]+/(?:[ \t]|$)')
+
+
+def _strip_trailing_digits(s: str) -> str:
+    """Drop trailing digits (sda1 -> sda)"""
+    i = len(s)
+    while i and s[i - 1].isdigit():
+        i -= 1
+    return s[:i]
+
+
+def _strip_partition(device: str) -> str:
+    """Turn a partition name or path into its disk (sda1 -> sda, nvme0n1p2 -> nvme0n1, mmcblk0p1 -> mmcblk0)"""
+    head, sep, name = device.rpartition('/')
+    if name.startswith(('nvme', 'mmcblk')):
+        match = _P_PARTITION.match(name)
+        if match:
+            name = match.group(1)
+    else:
+        name = _strip_trailing_digits(name)
+    return head + sep + name
+
 
 def get_os_drive() -> tuple[Optional[str], Optional[str]]:
+    """
+    Get the OS drive, detecting it on first use.
+    
+    A failed detection is not remembered, so the next call tries again
+    (and is_os_drive keeps rejecting every device until one succeeds).
+    
+    Returns:
+        tuple: (device_name, device_path) e.g., ('sda', '/dev/sda')
+               Returns (None, None) if detection fails
+    """
+    global _os_drive, _os_drive_members
+    if _os_drive is None:
+        device_name, device_path = _os_drive_from_override()
+        if not device_name:
+            device_name, device_path = _detect_os_drive()
+        if not device_name:
+            return None, None
+        _os_drive_members = frozenset({device_name} | _os_member_disks())
+        _os_drive = (device_name, device_path)
+    return _os_drive
+
+
+def get_os_drive_names() -> Set[str]:
+    """
+    Names of every disk the OS lives on (e.g. {'sda', 'sdb'} for a RAID1 root).
+    
+    Returns:
+        set: Disk names, empty if detection fails
+    """
+    if get_os_drive()[0] is None:
+        return set()
+    return set(_os_drive_members)
+
+
+def clear_os_drive_cache():
+    """Forget the detected OS drive so the next get_os_drive() detects again"""
+    global _os_drive, _os_drive_members
+    _os_drive = None
+    _os_drive_members = frozenset()
+
+
+def _os_drive_from_override() -> tuple[Optional[str], Optional[str]]:
+    """Use the OS_DRIVE_OVERRIDE setting instead of detecting, if it names a drive"""
+    if not OS_DRIVE_OVERRIDE:
+        return None, None
+    device_name, device_path = _normalize_device(OS_DRIVE_OVERRIDE)
+    if not device_name:
+        print(f"WARNING: OS_DRIVE_OVERRIDE={OS_DRIVE_OVERRIDE!r} is not a drive, detecting instead")
+    return device_name, device_path
+
+
+def _detect_os_drive() -> tuple[Optional[str], Optional[str]]:
     """
     Detect the OS drive using multiple methods for reliability.
     
@@ -55,15 +156,14 @@ def get_os_drive() -> tuple[Optional[str], Optional[str]]:
 def _get_root_device_from_mounts() -> Optional[str]:
     """Get root device from /proc/mounts"""
     try:
-        with open('/proc/mounts', 'r') as f:
-            for line in f:
-                parts = line.split()
-                if len(parts) >= 2 and parts[1] == '/':
-                    device = parts[0]
-                    # Remove partition number if present (e.g., /dev/sda1 -> /dev/sda)
-                    if device.startswith('/dev/'):
-                        device = re.sub(r'(\d+)$', '', device)
-                    return device
+        with open('/proc/mounts', 'rb') as f:
+            match = _ROOT_MOUNT_RE.search(f.read())
+        if match:
+            device = match.group(1).decode()
+            # Remove partition number if present (e.g., /dev/sda1 -> /dev/sda)
+            if device.startswith('/dev/'):
+                device = _strip_partition(device)
+            return device
     except Exception as e:
         print(f"Error reading /proc/mounts: {e}")
     return None
@@ -72,38 +172,133 @@ def _get_root_device_from_mounts() -> Optional[str]:
 def _get_root_device_from_fstab() -> Optional[str]:
     """Get root device from /etc/fstab"""
     try:
-        with open('/etc/fstab', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == '/':
-                        device = parts[0]
-                        if device.startswith('/dev/'):
-                            device = re.sub(r'(\d+)$', '', device)
-                        return device
+        with open('/etc/fstab', 'rb') as f:
+            match = _ROOT_MOUNT_RE.search(f.read())
+        if match:
+            device = match.group(1).decode()
+            if device.startswith('/dev/'):
+                device = _strip_partition(device)
+            return device
     except Exception as e:
         print(f"Error reading /etc/fstab: {e}")
     return None
 
 
+def _scan_mountinfo() -> dict:
+    """
+    Map the '/' and '/boot' mount points to their 'major:minor' device numbers.
+    
+    Reads /proc/self/mountinfo, whose third field is the device number and
+    fifth the mount point. Later entries win, matching stacked mounts.
+    """
+    devices = {}
+    try:
+        with open('/proc/self/mountinfo', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 5 and parts[4] in ('/', '/boot'):
+                    devices[parts[4]] = parts[2]
+    except OSError as e:
+        print(f"Error reading /proc/self/mountinfo: {e}")
+    return devices
+
+
+def _disks_from_dev_number(dev_number: str) -> Optional[Set[str]]:
+    """
+    Resolve a 'major:minor' number to the names of the whole disks beneath it.
+    
+    /sys/dev/block/8:1 links to .../block/sda/sda1; a partition's disk is
+    its parent directory. LVM and RAID devices (dm-0, md0) are followed
+    through all of their 'slaves', so a mirror or multi-PV volume group
+    yields every member disk. Returns None if any branch doesn't end at a
+    disk, so callers fall back to the lsblk tree walk.
+    """
+    try:
+        real_path = os.path.realpath(f'/sys/dev/block/{dev_number}')
+        if not os.path.isdir(real_path):
+            return None
+        disks = set()
+        pending = [(real_path, 0)]
+        while pending:
+            path, depth = pending.pop()
+            slaves_dir = os.path.join(path, 'slaves')
+            slaves = os.listdir(slaves_dir) if os.path.isdir(slaves_dir) else []
+            if slaves:
+                # Bounded so a malformed /sys can't loop forever
+                if depth >= _MAX_HOLDER_DEPTH:
+                    return None
+                pending.extend((os.path.realpath(os.path.join(slaves_dir, slave)), depth + 1)
+                               for slave in slaves)
+                continue
+            if os.path.exists(os.path.join(path, 'partition')):
+                path = os.path.dirname(path)
+            disk_name = os.path.basename(path)
+            if not disk_name.startswith(_VALID_PREFIXES):
+                return None
+            disks.add(disk_name)
+    except OSError:
+        return None
+    return disks
+
+
+def _get_mounted_disks(mount_point: str) -> Optional[Set[str]]:
+    """Names of the whole disks backing a mount point ('/' or '/boot'), from /proc and /sys only"""
+    devices = _scan_mountinfo()
+    # Without a separate /boot mount, /boot lives on the root filesystem
+    dev_number = devices.get(mount_point) or devices.get('/')
+    if not dev_number:
+        return None
+    return _disks_from_dev_number(dev_number)
+
+
+def _get_mounted_disk(mount_point: str) -> Optional[str]:
+    """One whole-disk device backing a mount point; _os_member_disks collects the rest"""
+    disks = _get_mounted_disks(mount_point)
+    if not disks:
+        return None
+    return f'/dev/{min(disks)}'
+
+
+def _os_member_disks() -> Set[str]:
+    """
+    Names of every disk holding the root or /boot filesystem.
+    
+    Unions the /sys walk with the lsblk tree, so a member missed by one
+    (e.g. a btrfs subvolume root /sys can't resolve) is still caught.
+    """
+    names = set()
+    for mount_point in ('/', '/boot'):
+        names |= _get_mounted_disks(mount_point) or set()
+    try:
+        for disk in _lsblk_json(['NAME', 'MOUNTPOINT'], whole_tree=True):
+            if _tree_has_mountpoint(disk, '/') or _tree_has_mountpoint(disk, '/boot'):
+                names.add(disk['name'])
+    except Exception as e:
+        print(f"Error using lsblk: {e}")
+    return names
+
+
 def _get_boot_device() -> Optional[str]:
     """Get device containing /boot directory"""
+    device = _get_mounted_disk('/boot')
+    if device:
+        return device
+    
+    # Fall back to df when /sys can't resolve the device (e.g. btrfs subvolumes)
     try:
         result = subprocess.run(
             ['df', '/boot'],
             capture_output=True,
-            text=True,
             timeout=5
         )
         if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
+            lines = result.stdout.decode('utf-8', errors='replace').strip().split('\n')
             if len(lines) > 1:
                 parts = lines[1].split()
                 if parts:
                     device = parts[0]
                     if device.startswith('/dev/'):
-                        device = re.sub(r'(\d+)$', '', device)
+                        device = _strip_partition(device)
                     return device
     except Exception as e:
         print(f"Error getting boot device: {e}")
@@ -112,26 +307,46 @@ def _get_boot_device() -> Optional[str]:
 
 def _get_root_device_from_lsblk() -> Optional[str]:
     """Get root device using lsblk"""
+    device = _get_mounted_disk('/')
+    if device:
+        return device
+    
     try:
-        result = subprocess.run(
-            ['lsblk', '-n', '-o', 'NAME,MOUNTPOINT'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0:
-            for line in result.stdout.strip().split('\n'):
-                parts = line.split()
-                if len(parts) >= 2 and parts[1] == '/':
-                    device_name = parts[0]
-                    # Remove partition number
-                    device_name = re.sub(r'(\d+)$', '', device_name)
-                    return f'/dev/{device_name}'
+        # Walk the device tree so the answer is the top-level disk, whether
+        # / sits on a partition, LVM volume or RAID member
+        for disk in _lsblk_json(['NAME', 'MOUNTPOINT'], whole_tree=True):
+            if _tree_has_mountpoint(disk, '/'):
+                return f"/dev/{disk['name']}"
     except Exception as e:
         print(f"Error using lsblk: {e}")
     return None
 
 
+def _lsblk_json(columns: list, whole_tree: bool = False) -> list:
+    """
+    Run lsblk once with JSON output and return its 'blockdevices' list.
+    
+    Args:
+        columns: lsblk output columns (e.g. ['NAME', 'TYPE'])
+        whole_tree: Include partitions and holders as 'children' (default: disks only)
+    """
+    cmd = ['lsblk', '-J', '-o', ','.join(columns)]
+    if not whole_tree:
+        cmd.insert(1, '-d')
+    # json.loads takes the raw bytes, so there's no separate decode pass
+    result = subprocess.run(cmd, capture_output=True, timeout=5)
+    if result.returncode != 0:
+        return []
+    return json.loads(result.stdout).get('blockdevices', [])
+
+
+def _tree_has_mountpoint(entry: dict, mount_point: str) -> bool:
+    """Whether an lsblk entry or any of its children is mounted at mount_point"""
+    if entry.get('mountpoint') == mount_point:
+        return True
+    return any(_tree_has_mountpoint(child, mount_point) for child in entry.get('children', ()))
+
+
 def _normalize_device(device: str) -> tuple[Optional[str], Optional[str]]:
     """
     Normalize device path to standard format.
@@ -160,11 +375,10 @@ def _normalize_device(device: str) -> tuple[Optional[str], Optional[str]]:
         device_name = device
     
     # Remove partition numbers (sda1 -> sda)
-    device_name = re.sub(r'(\d+)$', '', device_name)
+    device_name = _strip_partition(device_name)
     
     # Ensure it's a block device (starts with sd, nvme, etc.)
-    if not (device_name.startswith('sd') or device_name.startswith('nvme') or 
-            device_name.startswith('hd')):
+    if not device_name.startswith(_VALID_PREFIXES):
         return None, None
     
     device_path = f'/dev/{device_name}'
@@ -186,21 +400,26 @@ def is_os_drive(device_path: str) -> bool:
     Returns:
         bool: True if device is the OS drive
     """
-    os_drive_name, os_drive_path = get_os_drive()
+    os_drive_names = get_os_drive_names()
     
-    if not os_drive_name or not os_drive_path:
+    if not os_drive_names:
         # If we can't detect OS drive, be conservative and reject
         print("WARNING: Could not detect OS drive. Rejecting device for safety.")
         return True
     
-    # Normalize input device
+    # Fast path for plain /dev/sdX-style names: no stat, no symlink resolution
+    name = device_path[5:] if device_path.startswith('/dev/') else device_path
+    if _strip_partition(name) in os_drive_names:
+        return True
+    
+    # Normalize input device (resolves by-uuid/by-id links)
     device_name, normalized_path = _normalize_device(device_path)
     
     if not device_name:
         return False
     
-    # Compare device names (e.g., 'sda' == 'sda')
-    return device_name == os_drive_name
+    # Compare device names (e.g., 'sda' == 'sda'), against every OS member disk
+    return device_name in os_drive_names
 
 
 def get_all_non_os_drives() -> Set[str]:
@@ -210,37 +429,57 @@ def get_all_non_os_drives() -> Set[str]:
     Returns:
         set: Set of device paths (e.g., {'/dev/sdb', '/dev/sdc'})
     """
-    os_drive_name, _ = get_os_drive()
+    os_drive_names = get_os_drive_names()
     drives = set()
     
-    try:
-        result = subprocess.run(
-            ['lsblk', '-d', '-n', '-o', 'NAME'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode == 0:
-            for line in result.stdout.strip().split('\n'):
-                device_name = line.strip()
-                
-                # Skip if OS drive
-                if os_drive_name and device_name == os_drive_name:
-                    continue
-                
-                # Only include block devices (sd*, nvme*, hd*)
-                if device_name.startswith(('sd', 'nvme', 'hd')):
-                    device_path = f'/dev/{device_name}'
-                    if os.path.exists(device_path):
-                        drives.add(device_path)
+    # /sys/block lists whole disks only; lsblk is the fallback where sysfs
+    # isn't available
+    device_names = _sys_block_disks()
+    if device_names is None:
+        try:
+            device_names = [entry.get('name', '') for entry in _lsblk_json(['NAME', 'TYPE'])
+                            if entry.get('type') == 'disk']
+        except Exception as e:
+            print(f"Error getting drive list: {e}")
+            return drives
     
-    except Exception as e:
-        print(f"Error getting drive list: {e}")
+    for device_name in device_names:
+        # Skip the OS drive and any other disk the OS lives on
+        if device_name in os_drive_names:
+            continue
+        
+        # Only include block devices (sd*, nvme*, hd*)
+        if device_name.startswith(('sd', 'nvme', 'hd')):
+            device_path = f'/dev/{device_name}'
+            if os.path.exists(device_path):
+                drives.add(device_path)
     
     return drives
 
 
+def _sys_block_disks() -> Optional[list]:
+    """
+    Names of the disks in /sys/block that have media (non-zero size).
+    
+    Returns:
+        list: Disk names (e.g., ['sda', 'nvme0n1']), or None if /sys/block
+              can't be read
+    """
+    names = []
+    try:
+        with os.scandir('/sys/block') as entries:
+            for entry in entries:
+                try:
+                    with open(f'/sys/block/{entry.name}/size') as f:
+                        if int(f.read()) == 0:
+                            continue
+                except (OSError, ValueError):
+                    pass
+                names.append(entry.name)
+    except OSError:
+        return None
+    return names
+
 if __name__ == '__main__':
     # Test OS drive detection
     os_name, os_path = get_os_drive()
@@ -1,25 +1,38 @@
 """
 Test Execution Engine
 
-Runs comprehensive tests in isolated processes to ensure:
+Runs comprehensive tests on a worker thread per drive to ensure:
 1. Tests on different drives never interfere
 2. Block size changes can run in parallel
-3. Each drive has its own process space
+3. Each drive's tools (smartctl, badblocks, ...) run in their own processes
+
+The work is orchestrating external tools, which releases the GIL while
+they run, so threads give the same parallelism as processes without the
+spawn cost, and progress updates land directly in the shared state.
 """
 
 import subprocess
-import multiprocessing
 import threading
 import time
+import io
 import json
+import logging
 import re
 import os
+import selectors
+import sys
+import shutil
+import tempfile
 from enum import Enum
-from typing import Dict, Optional, Callable
-from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Callable
+from dataclasses import dataclass, field, fields
 from datetime import datetime
+from config import LOG_DIR
 from os_drive_detector import is_os_drive
 
+_log = logging.getLogger(__name__)
+
 # Try to import HDSentinel integration
 try:
     from hdsentinel_integration import HDSentinelIntegration
@@ -29,6 +42,112 @@ except ImportError:
     HDSentinelIntegration = None
 
 
+# Tool output patterns, compiled once rather than looked up per line
+# badblocks -s: "Testing with random pattern: 12.34% done, 0:05 elapsed"
+_BADBLOCKS_PROGRESS_RE = re.compile(rb'(\d+\.\d+)% done')
+_LINE_END_RE = re.compile(rb'\r\n?|\n')
+_DD_SPEED_RE = re.compile(r'(\d+\.?\d*)\s*(MB/s|GB/s)')
+_SMART_HEALTH_RE = re.compile(r'SMART overall-health self-assessment test result: (\w+)')
+# Numbers in a progress step ("... 12.3%", "... (40s)"), ignored when comparing steps
+_STEP_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+# Resolved once; the fio tests then exec it by absolute path
+_FIO_PATH = shutil.which('fio')
+
+# Absolute paths of the tools found so far (smartctl, badblocks, ...)
+_TOOL_PATHS: Dict[str, str] = {}
+
+
+def _tool_path(name: str) -> str:
+    """
+    Absolute path of a tool on PATH, looked up once.
+    
+    subprocess only takes the posix_spawn() fast path for a program given
+    with a directory. Tools that aren't found are returned unchanged, so
+    Popen reports them as usual and a later install is picked up.
+    """
+    if os.sep in name:
+        return name
+    path = _TOOL_PATHS.get(name)
+    if path is None:
+        path = shutil.which(name)
+        if path is None:
+            return name
+        _TOOL_PATHS[name] = path
+    return path
+
+
+# fio [global] ioengine lines, chosen on first use
+_FIO_ENGINE_OPTIONS: Optional[str] = None
+
+
+def _fio_engine_options() -> str:
+    """
+    fio [global] ioengine lines for this host, probed once.
+    
+    io_uring (kernel 5.1+) with pre-registered buffers and files really keeps
+    iodepth requests in flight; elsewhere libaio, which also queues. A new
+    enough kernel isn't sufficient: container seccomp profiles and
+    kernel.io_uring_disabled block it, so a tiny fio job checks it works.
+    """
+    global _FIO_ENGINE_OPTIONS
+    if _FIO_ENGINE_OPTIONS is None:
+        if _io_uring_usable():
+            _FIO_ENGINE_OPTIONS = "ioengine=io_uring\nfixedbufs=1\nregisterfiles=1\nsqthread_poll=0\n"
+        else:
+            _FIO_ENGINE_OPTIONS = "ioengine=libaio\n"
+    return _FIO_ENGINE_OPTIONS
+
+
+def _io_uring_usable() -> bool:
+    """Whether fio can set up an io_uring queue here (one 4k read of /dev/zero)"""
+    try:
+        major, minor = (int(part) for part in
+                        re.match(r'(\d+)\.(\d+)', os.uname().release).groups())
+    except (AttributeError, ValueError):
+        major, minor = 0, 0
+    if (major, minor) < (5, 1) or not _FIO_PATH:
+        return False
+    
+    try:
+        result = subprocess.run(
+            [_FIO_PATH, '--name=io_uring-probe', '--ioengine=io_uring',
+             '--filename=/dev/zero', '--rw=read', '--bs=4k', '--size=4k'],
+            capture_output=True,
+            timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        _log.warning("fio io_uring probe failed, using libaio: %s", e)
+        return False
+    if result.returncode != 0:
+        _log.info("io_uring unavailable, using libaio: %s",
+                  result.stderr.decode('utf-8', errors='replace').strip())
+        return False
+    return True
+
+
+# Scratch files for write benchmarks live on disk-backed /var/tmp, not on
+# /tmp, which is often tmpfs
+_SCRATCH_DIR = '/var/tmp'
+
+
+def _read_sys_block(device_path: str, attribute: str) -> Optional[int]:
+    """
+    Integer attribute of a whole disk from /sys/block (e.g. 'size',
+    'queue/logical_block_size'), or None where sysfs doesn't have it.
+    """
+    try:
+        with open(f"/sys/block/{os.path.basename(device_path)}/{attribute}") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class TestCancelled(Exception):
+    """Raised inside a test thread once stop_test() has been called for its drive"""
+
+
 class TestStatus(Enum):
     """Test execution status"""
     PENDING = "pending"
@@ -38,7 +157,9 @@ class TestStatus(Enum):
     CANCELLED = "cancelled"
 
 
-@dataclass
+# Slotted on Python 3.10+: one TestProgress per drive is written on every
+# progress tick, and slots make those writes cheaper than __dict__ updates
+@dataclass(**({'slots': True} if sys.version_info >= (3, 10) else {}))
 class TestProgress:
     """Progress information for a running test"""
     device_path: str
@@ -50,27 +171,77 @@ class TestProgress:
     elapsed_seconds: float
     error_message: Optional[str] = None
     result_data: Optional[Dict] = None
+    # Clock for elapsed_seconds; start_time is wall-clock, for display
+    start_monotonic: float = field(default_factory=time.monotonic, repr=False)
+
+
+_PROGRESS_FIELDS = tuple(f.name for f in fields(TestProgress) if f.name != 'start_monotonic')
+
+
+def _progress_snapshot(progress: TestProgress) -> Dict:
+    """
+    TestProgress as a JSON-ready dict for callbacks, without asdict()'s deep copy.
+    
+    status and start_time are sent as their value and ISO string, since the
+    callback's snapshot is emitted to clients as is. result_data gets a
+    shallow copy since the test keeps adding to it while the callback's
+    consumer may still be serializing the snapshot.
+    """
+    snapshot = {name: getattr(progress, name) for name in _PROGRESS_FIELDS}
+    snapshot['status'] = progress.status.value
+    snapshot['start_time'] = progress.start_time.isoformat()
+    if progress.result_data is not None:
+        snapshot['result_data'] = dict(progress.result_data)
+    return snapshot
 
 
 class TestExecutor:
     """
-    Executes comprehensive tests in isolated processes.
+    Executes comprehensive tests on per-drive worker threads.
     
-    Each drive gets its own process, allowing parallel execution
+    Each drive gets its own thread, allowing parallel execution
     without interference between drives.
     """
     
+    PROGRESS_CALLBACK_INTERVAL = 0.25  # seconds between progress callbacks for a drive
+    STOP_KILL_GRACE = 2.0  # seconds stop_test() gives a tool to exit after SIGTERM
+    
+    # test_type -> method that runs it; only _run_format_test takes test_params
+    _TEST_HANDLERS = {
+        'hdsentinel': '_run_hdsentinel_test',
+        'hdsentinel_health': '_run_hdsentinel_test',
+        'smart': '_run_smart_full_test',
+        'smart_full': '_run_smart_full_test',
+        'smart_short': '_run_smart_short_test',
+        'smart_extended': '_run_smart_extended_test',
+        'smart_conveyance': '_run_smart_conveyance_test',
+        'badblocks_read': '_run_badblocks_read_test',
+        'badblocks_write': '_run_badblocks_write_test',
+        'badblocks': '_run_badblocks_read_test',  # Default to read-only
+        'performance_seq': '_run_performance_sequential_test',
+        'performance_random': '_run_performance_random_test',
+        'format': '_run_format_test',
+        'block_size': '_run_format_test',
+        'health_check': '_run_health_check_test',
+    }
+    
     def __init__(self):
-        self.active_tests: Dict[str, multiprocessing.Process] = {}
+        self.active_tests: Dict[str, threading.Thread] = {}
+        self.cancel_events: Dict[str, threading.Event] = {}  # set by stop_test()
+        self.child_processes: Dict[str, subprocess.Popen] = {}  # tool currently running per drive
         self.test_progress: Dict[str, TestProgress] = {}
+        self._progress_view = MappingProxyType(self.test_progress)  # see get_all_progress()
         self.progress_callbacks: Dict[str, Callable] = {}
+        self.serial_paths: Dict[str, str] = {}  # drive serial -> device_path of its last test
         self._lock = threading.Lock()
+        self._hdsentinel = None  # shared HDSentinelIntegration, see _get_hdsentinel()
+        self._last_emit: Dict[str, float] = {}  # time.monotonic() of each drive's last callback
     
     def start_test(self, device_path: str, test_type: str, 
                    progress_callback: Optional[Callable] = None,
                    test_params: Optional[Dict] = None) -> bool:
         """
-        Start a test on a drive in an isolated process.
+        Start a test on a drive on its own worker thread.
         
         Args:
             device_path: Path to device (e.g., '/dev/sdb')
@@ -90,9 +261,9 @@ class TestExecutor:
         with self._lock:
             # Check if test already running for this drive
             if device_path in self.active_tests:
-                test_proc = self.active_tests[device_path]
-                if test_proc.is_alive():
-                    print(f"Test already running on {device_path}")
+                test_thread = self.active_tests[device_path]
+                if test_thread.is_alive():
+                    _log.info("Test already running on %s", device_path)
                     return False
             
             # Create progress tracker
@@ -111,73 +282,70 @@ class TestExecutor:
             if progress_callback:
                 self.progress_callbacks[device_path] = progress_callback
             
-            # Start test in isolated process
-            process = multiprocessing.Process(
+            self.cancel_events[device_path] = threading.Event()
+            
+            # Start test on its own thread
+            thread = threading.Thread(
                 target=self._run_test_isolated,
-                args=(device_path, test_type, progress, test_params or {})
+                args=(device_path, test_type, progress, test_params or {}),
+                name=f"test-{device_path}",
+                daemon=True
             )
-            process.start()
-            
-            self.active_tests[device_path] = process
+            self.active_tests[device_path] = thread
+            thread.start()
             
             return True
     
     def _run_test_isolated(self, device_path: str, test_type: str, 
                            progress: TestProgress, test_params: Dict):
         """
-        Run test in isolated process.
+        Run test on the drive's worker thread.
         
-        This runs in a separate process, ensuring complete isolation
-        from other drive tests.
+        Nothing here is shared with other drives' tests except the
+        executor's registries, which are guarded by self._lock.
         """
         try:
             # Update progress
             self._update_progress(device_path, "Initializing test...", 5.0)
             
             # Route to appropriate test function
-            if test_type == 'hdsentinel' or test_type == 'hdsentinel_health':
-                self._run_hdsentinel_test(device_path, progress)
-            elif test_type == 'smart' or test_type == 'smart_full':
-                self._run_smart_full_test(device_path, progress)
-            elif test_type == 'smart_short':
-                self._run_smart_short_test(device_path, progress)
-            elif test_type == 'smart_extended':
-                self._run_smart_extended_test(device_path, progress)
-            elif test_type == 'smart_conveyance':
-                self._run_smart_conveyance_test(device_path, progress)
-            elif test_type == 'badblocks_read':
-                self._run_badblocks_read_test(device_path, progress)
-            elif test_type == 'badblocks_write':
-                self._run_badblocks_write_test(device_path, progress)
-            elif test_type == 'badblocks':
-                self._run_badblocks_read_test(device_path, progress)  # Default to read-only
-            elif test_type == 'performance_seq':
-                self._run_performance_sequential_test(device_path, progress)
-            elif test_type == 'performance_random':
-                self._run_performance_random_test(device_path, progress)
-            elif test_type == 'format' or test_type == 'block_size':
-                self._run_format_test(device_path, progress, test_params)
-            elif test_type == 'health_check':
-                self._run_health_check_test(device_path, progress)
-            else:
+            handler_name = self._TEST_HANDLERS.get(test_type)
+            if handler_name is None:
                 raise ValueError(f"Unknown test type: {test_type}")
+            handler = getattr(self, handler_name)
+            if handler_name == '_run_format_test':
+                handler(device_path, progress, test_params)
+            else:
+                handler(device_path, progress)
             
             # Mark as completed
-            self._update_progress(device_path, "Test completed", 100.0)
-            progress.status = TestStatus.COMPLETED
+            self._check_cancelled(device_path)
+            self._update_progress(device_path, "Test completed", 100.0,
+                                  final_status=TestStatus.COMPLETED)
             
+        except TestCancelled:
+            self._update_progress(device_path, "Test cancelled", progress.progress_percent,
+                                  final_status=TestStatus.CANCELLED)
+        
         except Exception as e:
+            if self._is_cancelled(device_path):
+                # The tool failed because stop_test() terminated it
+                self._update_progress(device_path, "Test cancelled", progress.progress_percent,
+                                      final_status=TestStatus.CANCELLED)
+                return
             error_msg = str(e)
-            print(f"Test failed on {device_path}: {error_msg}")
-            progress.status = TestStatus.FAILED
+            _log.error("Test failed on %s: %s", device_path, error_msg)
             progress.error_message = error_msg
-            self._update_progress(device_path, f"Error: {error_msg}", progress.progress_percent)
+            self._update_progress(device_path, f"Error: {error_msg}", progress.progress_percent,
+                                  final_status=TestStatus.FAILED)
         
         finally:
-            # Cleanup
+            # Cleanup (unless a newer test already took over this drive)
             with self._lock:
-                if device_path in self.active_tests:
+                if self.active_tests.get(device_path) is threading.current_thread():
                     del self.active_tests[device_path]
+                    self.cancel_events.pop(device_path, None)
+                    self._last_emit.pop(device_path, None)
     
     def _run_hdsentinel_test(self, device_path: str, progress: TestProgress):
         """Run actual HDSentinel health check"""
@@ -187,7 +355,7 @@ class TestExecutor:
         self._update_progress(device_path, "Initializing HDSentinel...", 5.0)
         
         try:
-            hdsentinel = HDSentinelIntegration()
+            hdsentinel = self._get_hdsentinel()
         except FileNotFoundError as e:
             raise Exception(f"HDSentinel binary not found: {e}")
         
@@ -201,6 +369,10 @@ class TestExecutor:
         
         # Get detailed report
         detailed_report = hdsentinel.get_detailed_report(device_path, 'txt')
+        report_path = self._save_report(device_path, 'hdsentinel', detailed_report['output'])
+        if report_path:
+            del detailed_report['output']
+            progress.result_data['hdsentinel_report_path'] = report_path
         progress.result_data['hdsentinel_report'] = detailed_report
         
         # Check for failures
@@ -230,28 +402,85 @@ class TestExecutor:
         
         self._update_progress(device_path, "HDSentinel health check completed", 100.0)
     
-    def _run_smart_full_test(self, device_path: str, progress: TestProgress):
-        """Run comprehensive SMART health test (HDSentinel-like)"""
-        self._update_progress(device_path, "Reading SMART attributes...", 10.0)
+    def _save_report(self, device_path: str, kind: str, report: str) -> Optional[str]:
+        """
+        Write a tool's full report under LOG_DIR/reports so result_data only
+        carries its path.
         
-        # Get full SMART information
-        result = subprocess.run(
-            ['smartctl', '-a', device_path],
-            capture_output=True,
-            text=True,
-            timeout=60
+        Returns:
+            str: Path of the report file, or None if it couldn't be written
+        """
+        report_dir = os.path.join(LOG_DIR, 'reports')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        report_path = os.path.join(
+            report_dir, f"{os.path.basename(device_path)}_{kind}_{timestamp}.txt"
         )
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            with open(report_path, 'w') as f:
+                f.write(report)
+        except OSError as e:
+            _log.warning("Could not save %s report for %s: %s", kind, device_path, e)
+            return None
+        return report_path
+    
+    def _get_hdsentinel(self) -> 'HDSentinelIntegration':
+        """
+        The executor's shared HDSentinelIntegration, created on first use.
         
-        if result.returncode != 0:
-            raise Exception(f"SMART test failed: {result.stderr}")
+        Sharing it keeps the binary lookup to once per process and lets every
+        drive's test reuse its parse and full-scan caches. A failed lookup
+        isn't kept, so installing HDSentinel takes effect on the next test.
         
-        output = result.stdout
-        progress.result_data['smart_output'] = output
+        Raises:
+            FileNotFoundError: If the HDSentinel binary can't be found
+        """
+        hdsentinel = self._hdsentinel
+        if hdsentinel is None:
+            with self._lock:
+                if self._hdsentinel is None:
+                    self._hdsentinel = HDSentinelIntegration()
+                hdsentinel = self._hdsentinel
+        return hdsentinel
+    
+    def _run_smart_full_test(self, device_path: str, progress: TestProgress):
+        """Run comprehensive SMART health test (HDSentinel-like)"""
+        self._update_progress(device_path, "Reading SMART attributes...", 10.0)
         
-        self._update_progress(device_path, "Parsing SMART attributes...", 30.0)
+        # Get full SMART information
+        data, result = self._run_smartctl_json(device_path, ['-a'], timeout=60)
+        
+        if data is not None:
+            # Bits 0-2: smartctl couldn't read the drive; higher bits report
+            # drive conditions, which the checks below evaluate
+            if result.returncode & 0x07:
+                messages = '; '.join(m.get('string', '') for m in data['smartctl'].get('messages', []))
+                raise Exception(f"SMART test failed: {messages or result.stderr}")
+            
+            self._update_progress(device_path, "Parsing SMART attributes...", 30.0)
+            smart_data = self._smart_attributes_from_json(data)
+            smart_status = data.get('smart_status')
+            health_status = None
+            if smart_status is not None:
+                health_status = 'PASSED' if smart_status.get('passed') else 'FAILED'
+        else:
+            # smartmontools < 7: parse the text report
+            result = self._run_command(
+                device_path,
+                ['smartctl', '-a', device_path],
+                timeout=60
+            )
+            
+            if result.returncode != 0:
+                raise Exception(f"SMART test failed: {result.stderr}")
+            
+            self._update_progress(device_path, "Parsing SMART attributes...", 30.0)
+            
+            # Parse critical SMART attributes
+            parsed = self._parse_smart_full(result.stdout)
+            smart_data = parsed['attributes']
+            health_status = parsed['health_status']
         
-        # Parse critical SMART attributes
-        smart_data = self._parse_smart_attributes(output)
         progress.result_data['smart_attributes'] = smart_data
         
         # Check for critical failures
@@ -297,197 +526,133 @@ class TestExecutor:
         # Check overall health status
         self._update_progress(device_path, "Evaluating health status...", 80.0)
         
-        if 'SMART overall-health self-assessment test result' in output:
-            health_match = re.search(r'SMART overall-health self-assessment test result: (\w+)', output)
-            if health_match:
-                health_status = health_match.group(1)
-                progress.result_data['health_status'] = health_status
-                if health_status != 'PASSED':
-                    failures.append(f"SMART health check: {health_status}")
+        if health_status:
+            progress.result_data['health_status'] = health_status
+            if health_status != 'PASSED':
+                failures.append(f"SMART health check: {health_status}")
         
         progress.result_data['failures'] = failures
         progress.result_data['warnings'] = warnings
         
         if failures:
+            # The raw report is only worth keeping to explain a failure
+            report_path = self._save_report(device_path, 'smart', result.stdout)
+            if report_path:
+                progress.result_data['smart_output_path'] = report_path
+            else:
+                progress.result_data['smart_output'] = result.stdout
             raise Exception(f"SMART test failed: {'; '.join(failures)}")
         
         self._update_progress(device_path, "SMART test passed", 100.0)
     
+    # test_type -> (smartctl -t argument, name in messages, max wait s, first poll interval s)
+    _SMART_SELFTESTS = {
+        'smart_short': ('short', 'short', 300, 10),
+        'smart_extended': ('long', 'extended', 9000, 30),
+        'smart_conveyance': ('conveyance', 'conveyance', 600, 15),
+    }
+    
     def _run_smart_short_test(self, device_path: str, progress: TestProgress):
         """Run SMART short self-test (typically 2 minutes)"""
-        self._update_progress(device_path, "Starting SMART short self-test...", 5.0)
-        
-        # Start short test
-        result = subprocess.run(
-            ['smartctl', '-t', 'short', device_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            raise Exception(f"Failed to start SMART short test: {result.stderr}")
-        
-        # Monitor test progress
-        self._update_progress(device_path, "Running SMART short self-test...", 20.0)
-        
-        # Wait and check status periodically
-        max_wait = 300  # 5 minutes max
-        elapsed = 0
-        while elapsed < max_wait:
-            time.sleep(10)
-            elapsed += 10
-            
-            # Check test status
-            status_result = subprocess.run(
-                ['smartctl', '-l', 'selftest', device_path],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if status_result.returncode == 0:
-                status_output = status_result.stdout
-                if 'Self-test execution status:' in status_output:
-                    if 'completed without error' in status_output.lower():
-                        self._update_progress(device_path, "SMART short test completed", 100.0)
-                        progress.result_data['test_result'] = 'PASSED'
-                        return
-                    elif 'self-test in progress' in status_output.lower():
-                        progress_pct = min(90.0, 20.0 + (elapsed / max_wait) * 70.0)
-                        self._update_progress(device_path, f"SMART short test in progress... ({elapsed}s)", progress_pct)
-                    elif 'failed' in status_output.lower() or 'error' in status_output.lower():
-                        raise Exception("SMART short test failed")
-        
-        raise Exception("SMART short test timed out")
+        self._run_smart_selftest(device_path, progress, 'smart_short')
     
     def _run_smart_extended_test(self, device_path: str, progress: TestProgress):
         """Run SMART extended self-test (typically 1-2 hours)"""
-        self._update_progress(device_path, "Starting SMART extended self-test...", 5.0)
-        
-        result = subprocess.run(
-            ['smartctl', '-t', 'long', device_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            raise Exception(f"Failed to start SMART extended test: {result.stderr}")
-        
-        self._update_progress(device_path, "Running SMART extended self-test (this may take 1-2 hours)...", 10.0)
-        
-        # Monitor for up to 2.5 hours
-        max_wait = 9000  # 2.5 hours
-        elapsed = 0
-        while elapsed < max_wait:
-            time.sleep(30)  # Check every 30 seconds
-            elapsed += 30
-            
-            status_result = subprocess.run(
-                ['smartctl', '-l', 'selftest', device_path],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if status_result.returncode == 0:
-                status_output = status_result.stdout
-                if 'completed without error' in status_output.lower():
-                    self._update_progress(device_path, "SMART extended test completed", 100.0)
-                    progress.result_data['test_result'] = 'PASSED'
-                    return
-                elif 'self-test in progress' in status_output.lower():
-                    progress_pct = min(95.0, 10.0 + (elapsed / max_wait) * 85.0)
-                    self._update_progress(device_path, f"SMART extended test in progress... ({elapsed//60}m)", progress_pct)
-                elif 'failed' in status_output.lower():
-                    raise Exception("SMART extended test failed")
-        
-        raise Exception("SMART extended test timed out")
+        self._run_smart_selftest(device_path, progress, 'smart_extended')
     
     def _run_smart_conveyance_test(self, device_path: str, progress: TestProgress):
         """Run SMART conveyance self-test (for shipping)"""
-        self._update_progress(device_path, "Starting SMART conveyance self-test...", 5.0)
-        
-        result = subprocess.run(
-            ['smartctl', '-t', 'conveyance', device_path],
-            capture_output=True,
-            text=True,
+        self._run_smart_selftest(device_path, progress, 'smart_conveyance')
+    
+    def _run_smart_selftest(self, device_path: str, progress: TestProgress, test_type: str):
+        """Start a drive self-test and poll its status until it completes (see _SMART_SELFTESTS)"""
+        kind, name, max_wait, poll_interval = self._SMART_SELFTESTS[test_type]
+        self._update_progress(device_path, f"Starting SMART {name} self-test...", 5.0)
+        
+        result = self._run_command(
+            device_path,
+            ['smartctl', '-t', kind, device_path],
             timeout=10
         )
         
         if result.returncode != 0:
-            raise Exception(f"Failed to start SMART conveyance test: {result.stderr}")
+            raise Exception(f"Failed to start SMART {name} test: {result.stderr}")
+        
+        self._update_progress(device_path, f"Running SMART {name} self-test...", 10.0)
+        
+        for status_output, elapsed in self._poll_selftest_status(device_path, poll_interval, max_wait):
+            status_lower = status_output.lower()
+            # The running test is the log's newest entry, listed above
+            # earlier tests that may have completed
+            if 'in progress' in status_lower:
+                progress_pct = min(95.0, 10.0 + (elapsed / max_wait) * 85.0)
+                shown = f"{elapsed}s" if elapsed < 120 else f"{elapsed // 60}m"
+                self._update_progress(device_path, f"SMART {name} test in progress... ({shown})", progress_pct)
+            elif 'completed without error' in status_lower:
+                self._update_progress(device_path, f"SMART {name} test completed", 100.0)
+                progress.result_data['test_result'] = 'PASSED'
+                return
+            elif 'failed' in status_lower or 'failure' in status_lower:
+                raise Exception(f"SMART {name} test failed")
+        
+        raise Exception(f"SMART {name} test timed out")
+    
+    def _poll_selftest_status(self, device_path: str, check_interval: float, max_wait: float,
+                              max_interval: float = 60):
+        """
+        Yield (smartctl -l selftest output, elapsed seconds) until max_wait runs out.
         
-        max_wait = 600  # 10 minutes max
-        elapsed = 0
-        while elapsed < max_wait:
-            time.sleep(15)
-            elapsed += 15
+        Waits on the test's cancel event rather than sleeping, so stop_test()
+        interrupts the wait at once. The interval starts at check_interval and
+        backs off by half again per poll, up to max_interval, since self-tests
+        rarely finish early. Polls where smartctl fails are skipped.
+        
+        Raises:
+            TestCancelled: If the test is stopped while waiting
+        """
+        cancel_event = self.cancel_events.get(device_path) or threading.Event()
+        start = time.monotonic()
+        interval = check_interval
+        while True:
+            remaining = max_wait - (time.monotonic() - start)
+            if remaining <= 0:
+                return
+            if cancel_event.wait(min(interval, remaining)):
+                self._check_cancelled(device_path)
+            interval = min(interval * 1.5, max(max_interval, check_interval))
             
-            status_result = subprocess.run(
+            status_result = self._run_command(
+                device_path,
                 ['smartctl', '-l', 'selftest', device_path],
-                capture_output=True,
-                text=True,
                 timeout=10
             )
-            
             if status_result.returncode == 0:
-                status_output = status_result.stdout
-                if 'completed without error' in status_output.lower():
-                    self._update_progress(device_path, "SMART conveyance test completed", 100.0)
-                    progress.result_data['test_result'] = 'PASSED'
-                    return
-                elif 'self-test in progress' in status_output.lower():
-                    progress_pct = min(90.0, 10.0 + (elapsed / max_wait) * 80.0)
-                    self._update_progress(device_path, f"SMART conveyance test in progress... ({elapsed}s)", progress_pct)
-        
-        raise Exception("SMART conveyance test timed out")
+                yield status_result.stdout, int(time.monotonic() - start)
     
     def _run_badblocks_read_test(self, device_path: str, progress: TestProgress):
         """Run badblocks read-only test"""
         self._update_progress(device_path, "Starting badblocks read test...", 5.0)
         
-        # Get device size for progress estimation
-        size_result = subprocess.run(
-            ['blockdev', '--getsize64', device_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        device_size = int(size_result.stdout.strip()) if size_result.returncode == 0 else 0
+        # Get device size for progress estimation (sysfs counts 512-byte sectors)
+        sectors = _read_sys_block(device_path, 'size')
+        if sectors is not None:
+            device_size = sectors * 512
+        else:
+            size_result = self._run_command(
+                device_path,
+                ['blockdev', '--getsize64', device_path],
+                timeout=10
+            )
+            device_size = int(size_result.stdout.strip()) if size_result.returncode == 0 else 0
         
         # Run badblocks in read-only mode with progress
-        process = subprocess.Popen(
+        process = self._start_process(
+            device_path,
             ['badblocks', '-v', '-s', '-e', '10', device_path],  # -e 10 = stop after 10 errors
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            text=False
         )
         
-        bad_blocks = []
-        last_progress = 5.0
-        
-        while process.poll() is None:
-            # Read output line by line
-            line = process.stdout.readline()
-            if line:
-                # Parse progress from badblocks output
-                # Format: "Testing with random pattern: 12.34% done, 0:05 elapsed"
-                progress_match = re.search(r'(\d+\.\d+)% done', line)
-                if progress_match:
-                    progress_pct = float(progress_match.group(1))
-                    last_progress = 5.0 + (progress_pct * 0.9)  # 5-95%
-                    self._update_progress(device_path, f"Badblocks read test: {progress_pct:.1f}%", last_progress)
-                
-                # Check for bad blocks
-                if 'bad' in line.lower() or 'error' in line.lower():
-                    bad_blocks.append(line.strip())
-            else:
-                time.sleep(1)
-        
-        process.wait()
+        bad_blocks = self._follow_badblocks(device_path, process, "Badblocks read test", 5.0, 0.9)  # 5-95%
         
         if bad_blocks:
             progress.result_data['bad_blocks'] = bad_blocks
@@ -499,37 +664,75 @@ class TestExecutor:
         self._update_progress(device_path, "Badblocks read test completed - no errors found", 100.0)
         progress.result_data['bad_blocks'] = []
     
+    def _follow_badblocks(self, device_path: str, process: subprocess.Popen, label: str,
+                          progress_start: float, progress_scale: float) -> list:
+        """
+        Report a running badblocks' progress until it exits.
+        
+        Both pipes are watched with a selector: badblocks -s writes its
+        progress to stderr, redrawn in place with carriage returns, so
+        output is split on CR as well as LF and never waits for a newline.
+        The selector timeout keeps cancellation checks going while the
+        tool is quiet.
+        
+        Returns:
+            list: stdout lines reporting bad blocks or errors
+        """
+        bad_blocks = []
+        pending = {process.stdout: b'', process.stderr: b''}
+        try:
+            with selectors.DefaultSelector() as selector:
+                for pipe in pending:
+                    selector.register(pipe, selectors.EVENT_READ)
+                while selector.get_map():
+                    for key, _ in selector.select(timeout=0.5):
+                        data = os.read(key.fd, 65536)
+                        if not data:
+                            selector.unregister(key.fileobj)
+                            lines = [pending[key.fileobj]]
+                        else:
+                            lines = _LINE_END_RE.split(pending[key.fileobj] + data)
+                            pending[key.fileobj] = lines.pop()
+                        
+                        # Only the newest progress line in a read matters
+                        for line in reversed(lines):
+                            progress_match = _BADBLOCKS_PROGRESS_RE.search(line)
+                            if progress_match:
+                                progress_pct = float(progress_match.group(1))
+                                self._update_progress(device_path, f"{label}: {progress_pct:.1f}%",
+                                                      progress_start + progress_pct * progress_scale)
+                                break
+                        
+                        # Check for bad blocks
+                        if key.fileobj is process.stdout:
+                            for line in lines:
+                                line_lower = line.lower()
+                                if b'bad' in line_lower or b'error' in line_lower:
+                                    bad_blocks.append(line.strip().decode('utf-8', errors='replace'))
+                    self._check_cancelled(device_path)
+        finally:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            process.stdout.close()
+            process.stderr.close()
+            self._release_process(device_path, process)
+        
+        return bad_blocks
+    
     def _run_badblocks_write_test(self, device_path: str, progress: TestProgress):
         """Run badblocks destructive write test (WARNING: Destroys data!)"""
         self._update_progress(device_path, "WARNING: Write test will destroy all data!", 5.0)
         time.sleep(2)  # Give user a moment to see warning
         
         # Run badblocks with write mode
-        process = subprocess.Popen(
+        process = self._start_process(
+            device_path,
             ['badblocks', '-v', '-w', '-s', '-e', '10', device_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            text=False
         )
         
-        bad_blocks = []
-        last_progress = 10.0
-        
-        while process.poll() is None:
-            line = process.stdout.readline()
-            if line:
-                progress_match = re.search(r'(\d+\.\d+)% done', line)
-                if progress_match:
-                    progress_pct = float(progress_match.group(1))
-                    last_progress = 10.0 + (progress_pct * 0.85)  # 10-95%
-                    self._update_progress(device_path, f"Badblocks write test: {progress_pct:.1f}%", last_progress)
-                
-                if 'bad' in line.lower() or 'error' in line.lower():
-                    bad_blocks.append(line.strip())
-            else:
-                time.sleep(1)
-        
-        process.wait()
+        bad_blocks = self._follow_badblocks(device_path, process, "Badblocks write test", 10.0, 0.85)  # 10-95%
         
         if bad_blocks:
             progress.result_data['bad_blocks'] = bad_blocks
@@ -540,57 +743,124 @@ class TestExecutor:
     
     def _run_performance_sequential_test(self, device_path: str, progress: TestProgress):
         """Run sequential read/write performance test"""
-        self._update_progress(device_path, "Running sequential read test...", 10.0)
-        
-        # Sequential read test using dd
-        read_result = subprocess.run(
-            ['dd', f'if={device_path}', 'of=/dev/null', 'bs=1M', 'count=1024', 'iflag=direct'],
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        if _FIO_PATH:
+            # One fio run: queued direct I/O shows what the drive can really do,
+            # where dd's single synchronous 1 MiB reads understate SSD/NVMe
+            self._update_progress(device_path, "Running sequential read/write test (fio)...", 10.0)
+            read_speed, write_speed = self._run_fio_sequential(device_path)
+        else:
+            self._update_progress(device_path, "Running sequential read test...", 10.0)
+            
+            # Sequential read test using dd
+            read_result = self._run_command(
+                device_path,
+                ['dd', f'if={device_path}', 'of=/dev/null', 'bs=1M', 'count=1024', 'iflag=direct'],
+                timeout=300
+            )
         
-        if read_result.returncode != 0:
-            raise Exception(f"Sequential read test failed: {read_result.stderr}")
+            if read_result.returncode != 0:
+                raise Exception(f"Sequential read test failed: {read_result.stderr}")
         
-        # Parse speed from dd output
-        speed_match = re.search(r'(\d+\.?\d*)\s*(MB/s|GB/s)', read_result.stderr)
-        read_speed = speed_match.group(1) if speed_match else "N/A"
+            # Parse speed from dd output
+            speed_match = _DD_SPEED_RE.search(read_result.stderr)
+            read_speed = speed_match.group(1) if speed_match else "N/A"
         
-        self._update_progress(device_path, "Running sequential write test...", 60.0)
+            self._update_progress(device_path, "Running sequential write test...", 60.0)
         
-        # Sequential write test (use a temporary file)
-        temp_file = f'/tmp/hdd_test_{os.getpid()}.tmp'
-        try:
-            write_result = subprocess.run(
-                ['dd', 'if=/dev/zero', f'of={temp_file}', 'bs=1M', 'count=1024', 'oflag=direct'],
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
+            # Sequential write test (use a temporary file)
+            with tempfile.NamedTemporaryFile(prefix='hdd_test_', suffix='.tmp', dir=_SCRATCH_DIR) as temp_file:
+                write_result = self._run_command(
+                    device_path,
+                    ['dd', 'if=/dev/zero', f'of={temp_file.name}', 'bs=1M', 'count=1024', 'oflag=direct'],
+                    timeout=300
+                )
             
             if write_result.returncode == 0:
-                speed_match = re.search(r'(\d+\.?\d*)\s*(MB/s|GB/s)', write_result.stderr)
+                speed_match = _DD_SPEED_RE.search(write_result.stderr)
                 write_speed = speed_match.group(1) if speed_match else "N/A"
             else:
                 write_speed = "N/A"
-        finally:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
         
         progress.result_data['sequential_read_speed'] = read_speed
         progress.result_data['sequential_write_speed'] = write_speed
         
         self._update_progress(device_path, "Performance test completed", 100.0)
     
+    def _run_fio_sequential(self, device_path: str) -> tuple:
+        """
+        Measure sequential read (from the drive) and write speed with one fio run.
+        
+        The write job targets a scratch file like the dd version does, so
+        this test never writes to the drive itself.
+        
+        Returns:
+            tuple: (read MB/s, write MB/s) as strings, "N/A" for a job that failed
+        """
+        with tempfile.NamedTemporaryFile(prefix='hdd_test_', suffix='.tmp', dir=_SCRATCH_DIR) as temp_file:
+            fio_result = self._run_command(
+                device_path,
+                [_FIO_PATH, '--output-format=json', '-'],
+                input=self._fio_sequential_config(device_path, temp_file.name),
+                timeout=120
+            )
+        
+        fio_data = self._parse_fio_json(fio_result.stdout)
+        if fio_data is None:
+            raise Exception(f"Sequential performance test failed: {fio_result.stderr}")
+        
+        jobs = {job.get('jobname'): job for job in fio_data.get('jobs', [])}
+        speeds = {}
+        for direction in ('read', 'write'):
+            job = jobs.get(f'seq-{direction}', {})
+            bw_bytes = job.get(direction, {}).get('bw_bytes', 0)
+            if job.get('error') or not bw_bytes:
+                speeds[direction] = "N/A"
+            else:
+                speeds[direction] = f"{bw_bytes / 1e6:.1f}"  # MB/s, as dd reported it
+        
+        if speeds['read'] == "N/A":
+            raise Exception(f"Sequential read test failed: {fio_result.stderr}")
+        return speeds['read'], speeds['write']
+    
+    @staticmethod
+    def _fio_sequential_config(device_path: str, scratch_file: str) -> str:
+        """fio job file: sequential read from the drive, then sequential write to scratch_file"""
+        return f"""
+[global]
+direct=1
+bs=1M
+iodepth=32
+{_fio_engine_options()}runtime=30
+time_based=1
+
+[seq-read]
+filename={device_path}
+rw=read
+
+[seq-write]
+stonewall
+filename={scratch_file}
+size=1G
+rw=write
+"""
+    
+    @staticmethod
+    def _parse_fio_json(output: str) -> Optional[Dict]:
+        """Parse fio --output-format=json output, skipping any warnings printed ahead of it"""
+        start = output.find('{')
+        if start < 0:
+            return None
+        try:
+            return json.loads(output[start:])
+        except ValueError:
+            return None
+    
     def _run_performance_random_test(self, device_path: str, progress: TestProgress):
         """Run random I/O performance test"""
         self._update_progress(device_path, "Running random I/O performance test...", 10.0)
         
         # Use fio if available, otherwise skip
-        fio_available = subprocess.run(['which', 'fio'], capture_output=True).returncode == 0
-        
-        if not fio_available:
+        if not _FIO_PATH:
             self._update_progress(device_path, "fio not available, skipping random I/O test", 100.0)
             progress.result_data['random_io_test'] = 'SKIPPED (fio not installed)'
             return
@@ -600,7 +870,7 @@ class TestExecutor:
 [global]
 filename={device_path}
 direct=1
-runtime=60
+{_fio_engine_options()}runtime=60
 time_based=1
 
 [random-read]
@@ -614,20 +884,23 @@ bs=4k
 iodepth=16
 """
         
-        fio_result = subprocess.run(
-            ['fio', '--output-format=json', '-'],
+        fio_result = self._run_command(
+            device_path,
+            [_FIO_PATH, '--output-format=json', '-'],
             input=fio_config,
-            capture_output=True,
-            text=True,
             timeout=120
         )
         
-        if fio_result.returncode == 0:
-            try:
-                fio_data = json.loads(fio_result.stdout)
-                progress.result_data['random_io'] = fio_data
-            except:
-                progress.result_data['random_io'] = fio_result.stdout
+        fio_data = self._parse_fio_json(fio_result.stdout) if fio_result.returncode == 0 else None
+        if fio_data is not None:
+            # Keep the headline numbers, not fio's full (very large) report
+            jobs = {job.get('jobname'): job for job in fio_data.get('jobs', [])}
+            progress.result_data['random_io'] = {
+                'read_iops': round(jobs.get('random-read', {}).get('read', {}).get('iops', 0), 1),
+                'write_iops': round(jobs.get('random-write', {}).get('write', {}).get('iops', 0), 1),
+            }
+        elif fio_result.returncode == 0:
+            progress.result_data['random_io'] = fio_result.stdout
         
         self._update_progress(device_path, "Random I/O test completed", 100.0)
     
@@ -640,21 +913,21 @@ iodepth=16
         filesystem = test_params.get('filesystem', 'ext4')
         
         # Get current block size
-        current_bs_result = subprocess.run(
-            ['blockdev', '--getbsz', device_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        current_block_size = int(current_bs_result.stdout.strip()) if current_bs_result.returncode == 0 else 0
+        current_block_size = _read_sys_block(device_path, 'queue/logical_block_size')
+        if current_block_size is None:
+            current_bs_result = self._run_command(
+                device_path,
+                ['blockdev', '--getss', device_path],
+                timeout=10
+            )
+            current_block_size = int(current_bs_result.stdout.strip()) if current_bs_result.returncode == 0 else 0
         progress.result_data['old_block_size'] = current_block_size
         progress.result_data['new_block_size'] = block_size
         
         self._update_progress(device_path, f"Changing block size to {block_size}...", 20.0)
         
         # Unmount if mounted
-        subprocess.run(['umount', device_path], capture_output=True)
+        self._run_command(device_path, ['umount', device_path])
         
         # Create partition table (if needed)
         self._update_progress(device_path, "Creating partition table...", 30.0)
@@ -667,10 +940,9 @@ iodepth=16
             mkfs_args.append('-q')  # Quick format
         
         # Use specific block size if supported
-        format_result = subprocess.run(
+        format_result = self._run_command(
+            device_path,
             ['mkfs', '-t', filesystem, '-b', str(block_size), device_path],
-            capture_output=True,
-            text=True,
             timeout=600
         )
         
@@ -684,125 +956,265 @@ iodepth=16
         """Run comprehensive health check (HDSentinel-like)"""
         self._update_progress(device_path, "Running comprehensive health check...", 5.0)
         
-        # Combine multiple checks
-        health_data = {}
-        
-        # SMART check
-        self._update_progress(device_path, "Checking SMART health...", 20.0)
-        try:
-            smart_result = subprocess.run(
-                ['smartctl', '-H', device_path],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            health_data['smart_health'] = smart_result.stdout
-        except:
-            health_data['smart_health'] = 'ERROR'
-        
-        # Temperature check
-        self._update_progress(device_path, "Checking temperature...", 40.0)
+        # One smartctl -x call covers health, attributes and identity
+        self._update_progress(device_path, "Reading SMART data...", 20.0)
         try:
-            temp_result = subprocess.run(
-                ['smartctl', '-A', device_path],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            temp_match = re.search(r'Temperature.*?(\d+)', temp_result.stdout)
-            if temp_match:
-                health_data['temperature'] = int(temp_match.group(1))
-        except:
-            pass
-        
-        # Power-on hours
-        self._update_progress(device_path, "Checking power-on hours...", 60.0)
-        try:
-            attr_result = subprocess.run(
-                ['smartctl', '-A', device_path],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            poh_match = re.search(r'Power_On_Hours.*?(\d+)', attr_result.stdout)
-            if poh_match:
-                health_data['power_on_hours'] = int(poh_match.group(1))
-        except:
-            pass
-        
-        # Connection type
-        self._update_progress(device_path, "Checking connection type...", 80.0)
-        try:
-            info_result = subprocess.run(
-                ['smartctl', '-i', device_path],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if 'SATA' in info_result.stdout:
-                health_data['connection_type'] = 'SATA'
-            elif 'SAS' in info_result.stdout:
-                health_data['connection_type'] = 'SAS'
-        except:
-            pass
+            data, result = self._run_smartctl_json(device_path, ['-x'], timeout=60)
+            if data is not None:
+                health_data = self._health_from_smart_json(data)
+            else:
+                # smartmontools < 7 has no --json; parse the text report instead
+                result = self._run_command(device_path, ['smartctl', '-x', device_path], timeout=60)
+                health_data = self._health_from_smart_text(result.stdout)
+        except TestCancelled:
+            raise
+        except Exception as e:
+            _log.warning("Error reading SMART data for %s: %s", device_path, e)
+            health_data = {'smart_health': 'ERROR'}
         
+        self._update_progress(device_path, "Checking health, temperature and power-on hours...", 80.0)
         progress.result_data['health_data'] = health_data
         self._update_progress(device_path, "Health check completed", 100.0)
     
-    def _parse_smart_attributes(self, smart_output: str) -> Dict:
-        """Parse SMART attributes from smartctl output"""
+    def _run_smartctl_json(self, device_path: str, args: list, timeout: float):
+        """
+        Run smartctl with --json=c.
+        
+        Returns:
+            tuple: (parsed JSON or None if this smartctl can't produce it,
+                    the CompletedProcess)
+        """
+        result = self._run_command(device_path, ['smartctl', *args, '--json=c', device_path],
+                                   timeout=timeout)
+        try:
+            data = json.loads(result.stdout)
+        except ValueError:
+            return None, result
+        # smartctl exit codes are a bitmask of drive conditions, so a non-zero
+        # code still comes with a complete report
+        if not isinstance(data, dict) or 'smartctl' not in data:
+            return None, result
+        return data, result
+    
+    @staticmethod
+    def _health_from_smart_json(data: Dict) -> Dict:
+        """Health check fields from smartctl --json output"""
+        health_data = {}
+        
+        smart_status = data.get('smart_status')
+        if smart_status is not None:
+            health_data['smart_health'] = 'PASSED' if smart_status.get('passed') else 'FAILED'
+        
+        temperature = data.get('temperature', {}).get('current')
+        if temperature is not None:
+            health_data['temperature'] = int(temperature)
+        
+        power_on_hours = data.get('power_on_time', {}).get('hours')
+        if power_on_hours is not None:
+            health_data['power_on_hours'] = int(power_on_hours)
+        
+        if 'sata_version' in data:
+            health_data['connection_type'] = 'SATA'
+        elif 'SAS' in data.get('scsi_transport_protocol', {}).get('name', ''):
+            health_data['connection_type'] = 'SAS'
+        
+        return health_data
+    
+    def _health_from_smart_text(self, output: str) -> Dict:
+        """Health check fields from smartctl -x text output"""
+        parsed = self._parse_smart_full(output)
+        health_data = {'smart_health': parsed['health_status'] or output}
+        
+        # Read the attribute table rather than the first digits after a name,
+        # which would pick up the FLAG column (0x0022)
+        if parsed['temperature'] is not None:
+            health_data['temperature'] = parsed['temperature']
+        if 'Power_On_Hours' in parsed['attributes']:
+            health_data['power_on_hours'] = parsed['attributes']['Power_On_Hours']['raw_value']
+        
+        if parsed['connection_type']:
+            health_data['connection_type'] = parsed['connection_type']
+        
+        return health_data
+    
+    @staticmethod
+    def _smart_attributes_from_json(data: Dict) -> Dict:
+        """SMART attributes from smartctl --json, keyed like _parse_smart_full's attributes"""
         attributes = {}
+        for attr in data.get('ata_smart_attributes', {}).get('table', []):
+            attributes[attr['name']] = {
+                'id': str(attr['id']),
+                'value': attr.get('value', 0),
+                'worst': attr.get('worst', 0),
+                'threshold': attr.get('thresh', 0),
+                'raw_value': attr.get('raw', {}).get('value', 0)
+            }
+        return attributes
+    
+    def _parse_smart_full(self, smart_output: str) -> Dict:
+        """
+        Parse smartctl -a/-x text output in a single pass over its lines.
+        
+        smartctl prints the identity and health sections before the
+        attribute table, so parsing stops where the table ends.
         
-        # Find the attributes section
-        lines = smart_output.split('\n')
+        Returns:
+            Dict: 'attributes' (keyed by attribute name), 'health_status',
+                'temperature' and 'connection_type' (None when not reported)
+        """
+        attributes = {}
+        health_status = None
+        connection_type = None
         in_attributes = False
         
-        for line in lines:
-            if 'ID#' in line and 'ATTRIBUTE_NAME' in line:
-                in_attributes = True
-                continue
-            
+        for line in io.StringIO(smart_output):
             if in_attributes:
                 if line.strip() == '':
                     break
                 
-                # Parse attribute line
-                # Format: "  1 Raw_Read_Error_Rate     0x002f   200   200   051    Pre-fail  Always       -       0"
-                match = re.match(r'\s*(\d+)\s+(\S+)\s+0x\w+\s+(\d+)\s+(\d+)\s+(\d+)\s+(\S+)\s+(\S+)\s+.*?(\d+)', line)
-                if match:
-                    attr_id = match.group(1)
-                    attr_name = match.group(2)
-                    value = int(match.group(3))
-                    worst = int(match.group(4))
-                    threshold = int(match.group(5))
-                    raw_value = int(match.group(8))
-                    
-                    attributes[attr_name] = {
-                        'id': attr_id,
-                        'value': value,
-                        'worst': worst,
-                        'threshold': threshold,
-                        'raw_value': raw_value
-                    }
+                # Parse attribute line: whitespace-separated fixed columns
+                # -a: "  1 Raw_Read_Error_Rate     0x002f   200   200   051    Pre-fail  Always       -       0"
+                # -x: "  1 Raw_Read_Error_Rate     POSR-K   200   200   051    -    0"
+                # RAW_VALUE may carry a suffix ("34 (Min/Max 20/45)", "1234h+05m+10s"):
+                # keep its leading digits
+                if not line[:4].lstrip()[:1].isdigit():
+                    continue  # legend/continuation line: IDs are right-aligned in 3 columns
+                parts = line.split()
+                raw_column = 9 if len(parts) > 2 and parts[2].startswith('0x') else 7
+                if len(parts) > raw_column and parts[0].isdigit():
+                    raw = parts[raw_column]
+                    raw_digits = len(raw) - len(raw.lstrip('0123456789'))
+                    try:
+                        attributes[parts[1]] = {
+                            'id': parts[0],
+                            'value': int(parts[3]),
+                            'worst': int(parts[4]),
+                            'threshold': int(parts[5]),
+                            'raw_value': int(raw[:raw_digits]) if raw_digits else 0
+                        }
+                    except ValueError:
+                        pass
+                continue
+            
+            if 'ID#' in line and 'ATTRIBUTE_NAME' in line:
+                in_attributes = True
+            elif health_status is None and line.startswith('SMART overall-health'):
+                health_match = _SMART_HEALTH_RE.match(line)
+                if health_match:
+                    health_status = health_match.group(1)
+            
+            if 'SATA' in line:
+                connection_type = 'SATA'
+            elif connection_type is None and 'SAS' in line:
+                connection_type = 'SAS'
+        
+        temperature = attributes.get('Temperature_Celsius')
+        return {
+            'attributes': attributes,
+            'health_status': health_status,
+            'temperature': temperature['raw_value'] if temperature else None,
+            'connection_type': connection_type
+        }
+    
+    def _run_command(self, device_path: str, cmd: list, input: Optional[str] = None,
+                     timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Run a tool for a drive's test, like subprocess.run(capture_output=True, text=True).
         
-        return attributes
+        The process is registered for the drive so stop_test() can terminate it.
+        
+        Raises:
+            TestCancelled: If the test was stopped before or while the tool ran
+            subprocess.TimeoutExpired: If the tool ran longer than timeout
+        """
+        self._check_cancelled(device_path)
+        process = self._start_process(device_path, cmd, stdin=subprocess.PIPE if input is not None else None)
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            self._release_process(device_path, process)
+        self._check_cancelled(device_path)
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
     
-    def _update_progress(self, device_path: str, current_step: str, progress_percent: float):
-        """Update progress for a test"""
+    def _start_process(self, device_path: str, cmd: list, text: bool = True,
+                       **kwargs) -> subprocess.Popen:
+        """Start a tool with piped output and register it as the drive's current process"""
+        # Absolute program path and close_fds=False let subprocess use
+        # posix_spawn() instead of fork+exec; Python's own fds are already
+        # non-inheritable, so nothing extra leaks into the tool
+        process = subprocess.Popen([_tool_path(cmd[0])] + cmd[1:],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   close_fds=False, text=text, **kwargs)
         with self._lock:
-            if device_path in self.test_progress:
-                progress = self.test_progress[device_path]
-                progress.current_step = current_step
-                progress.progress_percent = progress_percent
-                progress.elapsed_seconds = (datetime.now() - progress.start_time).total_seconds()
-                
-                # Call callback if registered
-                if device_path in self.progress_callbacks:
-                    try:
-                        callback = self.progress_callbacks[device_path]
-                        callback(asdict(progress))
-                    except Exception as e:
-                        print(f"Error in progress callback: {e}")
+            self.child_processes[device_path] = process
+        if self._is_cancelled(device_path):
+            # stop_test() ran between the check and the registration
+            process.terminate()
+        return process
+    
+    def _release_process(self, device_path: str, process: subprocess.Popen):
+        """Forget a drive's tool once it has exited"""
+        with self._lock:
+            if self.child_processes.get(device_path) is process:
+                del self.child_processes[device_path]
+    
+    def _is_cancelled(self, device_path: str) -> bool:
+        """Whether stop_test() has been called for the drive's current test"""
+        event = self.cancel_events.get(device_path)
+        return event is not None and event.is_set()
+    
+    def _check_cancelled(self, device_path: str):
+        """Raise TestCancelled if stop_test() has been called for the drive"""
+        if self._is_cancelled(device_path):
+            raise TestCancelled(f"Test on {device_path} was cancelled")
+    
+    def _update_progress(self, device_path: str, current_step: str, progress_percent: float,
+                         final_status: Optional[TestStatus] = None):
+        """
+        Update progress for a test (also a cancellation point for the test thread).
+        
+        final_status ends the test: it is set along with the step, and the
+        update always reaches the callback, even for a cancelled test.
+        """
+        if final_status is None:
+            self._check_cancelled(device_path)
+        now = time.monotonic()
+        with self._lock:
+            progress = self.test_progress.get(device_path)
+            if progress is None:
+                return
+            if final_status is not None:
+                progress.status = final_status
+            # Steps like "Badblocks read test: 12.3%" carry their own numbers;
+            # only a change in the wording counts as a new step
+            step_unchanged = (_STEP_NUMBER_RE.sub('#', progress.current_step)
+                              == _STEP_NUMBER_RE.sub('#', current_step))
+            progress.current_step = current_step
+            progress.progress_percent = progress_percent
+            progress.elapsed_seconds = now - progress.start_monotonic
+            
+            # Coalesce callbacks: badblocks reports many times a second.
+            # New steps, completion and the final status always go through.
+            if (final_status is None and progress_percent < 100 and step_unchanged
+                    and now - self._last_emit.get(device_path, 0) < self.PROGRESS_CALLBACK_INTERVAL):
+                return
+            self._last_emit[device_path] = now
+            
+            callback = self.progress_callbacks.get(device_path)
+            if callback is None:
+                return
+            snapshot = _progress_snapshot(progress)
+        
+        # Call the callback outside the lock: it may be slow, and stop_test()
+        # and the other drives' updates shouldn't wait on it
+        try:
+            callback(snapshot)
+        except Exception as e:
+            _log.warning("Progress callback failed for %s: %s", device_path, e)
     
     def stop_test(self, device_path: str) -> bool:
         """
@@ -815,37 +1227,82 @@ iodepth=16
             bool: True if test was stopped
         """
         with self._lock:
-            if device_path in self.active_tests:
-                process = self.active_tests[device_path]
-                if process.is_alive():
-                    process.terminate()
-                    process.join(timeout=5)
-                    if process.is_alive():
-                        process.kill()
-                    
-                    if device_path in self.test_progress:
-                        self.test_progress[device_path].status = TestStatus.CANCELLED
-                    
-                    del self.active_tests[device_path]
-                    return True
-        return False
+            thread = self.active_tests.get(device_path)
+            event = self.cancel_events.get(device_path)
+            if thread is None or not thread.is_alive() or event is None or event.is_set():
+                return False
+            
+            # Threads can't be killed: flag the test so it stops at its next
+            # check, and terminate the tool it is waiting on right now
+            event.set()
+            process = self.child_processes.get(device_path)
+            
+            if device_path in self.test_progress:
+                self.test_progress[device_path].status = TestStatus.CANCELLED
+        
+        # The tool is signalled outside the lock, and a SIGKILL follows on a
+        # timer if it ignores SIGTERM, so stopping many drives never blocks
+        # the rest of the executor
+        if process is not None and process.poll() is None:
+            process.terminate()
+            killer = threading.Timer(self.STOP_KILL_GRACE, self._kill_if_running, args=(process,))
+            killer.daemon = True
+            killer.start()
+        
+        # The entry stays until the thread exits, so a new test can't
+        # start on the drive while this one is still winding down
+        return True
+    
+    @staticmethod
+    def _kill_if_running(process: subprocess.Popen):
+        """SIGKILL a tool that outlived its SIGTERM grace period"""
+        if process.poll() is None:
+            process.kill()
+    
+    def register_serial(self, serial: str, device_path: str):
+        """Remember which device a drive's test was started on"""
+        with self._lock:
+            # A serial seen on this path before belongs to a drive that has
+            # since been pulled; its mapping now points at another drive
+            for stale_serial in [s for s, path in self.serial_paths.items()
+                                 if path == device_path and s != serial]:
+                del self.serial_paths[stale_serial]
+            self.serial_paths[serial] = device_path
+    
+    # The status readers below don't take self._lock. A single get(), copy()
+    # or list() of a dict with str keys runs entirely in C, so under the
+    # GIL it is atomic with respect to the locked writers and never sees a
+    # half-updated registry.
+    
+    def device_path_for_serial(self, serial: str) -> Optional[str]:
+        """Get the device path a drive's test was started on, if any"""
+        return self.serial_paths.get(serial)
     
     def get_progress(self, device_path: str) -> Optional[TestProgress]:
         """Get current progress for a test"""
-        with self._lock:
-            return self.test_progress.get(device_path)
+        return self.test_progress.get(device_path)
     
-    def get_all_progress(self) -> Dict[str, TestProgress]:
-        """Get progress for all active tests"""
-        with self._lock:
-            return self.test_progress.copy()
+    def get_all_progress(self) -> Mapping[str, TestProgress]:
+        """
+        Get progress for all active tests.
+        
+        This is a live read-only view, not a copy: len() and lookups are
+        safe at any time, but take dict(view) before iterating, since a
+        test starting meanwhile would change its size.
+        """
+        return self._progress_view
+    
+    def get_running_device_paths(self) -> frozenset:
+        """Get device paths of all running tests as one consistent snapshot"""
+        return frozenset(
+            device_path for device_path, thread in list(self.active_tests.items())
+            if thread.is_alive()
+        )
     
     def is_test_running(self, device_path: str) -> bool:
         """Check if a test is running on a drive"""
-        with self._lock:
-            if device_path in self.active_tests:
-                return self.active_tests[device_path].is_alive()
-            return False
+        thread = self.active_tests.get(device_path)
+        return thread is not None and thread.is_alive()
 
 
 if __name__ == '__main__':
@@ -856,7 +1313,7 @@ if __name__ == '__main__':
     # executor.start_test('/dev/sdb', 'smart')
     
     print("Test executor initialized")
-    print("Each drive runs in isolated process for parallel execution")
+    print("Each drive runs on its own worker thread for parallel execution")
     print("\nAvailable test types:")
     print("  - smart / smart_full: Comprehensive SMART health check")
     print("  - smart_short: SMART short self-test (~2 min)")
@@ -6,9 +6,12 @@ Verifies that OS drive detection and isolation work correctly.
 Run this before deploying to production.
 """
 
+import json
+from datetime import datetime
+
 from os_drive_detector import get_os_drive, is_os_drive, get_all_non_os_drives
 from drive_detector import DriveDetector
-from test_executor import TestExecutor
+from test_executor import TestExecutor, TestProgress, TestStatus
 
 
 def test_os_drive_detection():
@@ -81,6 +84,27 @@ def test_test_executor():
     print("=" * 60)
     
     executor = TestExecutor()
+    
+    # Progress callbacks are emitted to clients as JSON; feed a test's
+    # progress through the executor to capture what a callback receives
+    updates = []
+    executor.test_progress['/dev/sdx'] = TestProgress(
+        device_path='/dev/sdx', test_type='smart', status=TestStatus.RUNNING,
+        progress_percent=0.0, current_step='Starting test...', start_time=datetime.now(),
+        elapsed_seconds=0.0, result_data={'failures': []}
+    )
+    executor.progress_callbacks['/dev/sdx'] = updates.append
+    executor._update_progress('/dev/sdx', 'Checking', 50.0)
+    del executor.test_progress['/dev/sdx'], executor.progress_callbacks['/dev/sdx']
+    try:
+        if not updates:
+            raise TypeError("no progress update was delivered")
+        json.dumps(updates[-1])
+        print("✓ Progress updates are JSON serializable")
+    except TypeError as e:
+        print(f"✗ ERROR: Progress update can't be sent to clients: {e}")
+        return False
+    
     os_name, os_path = get_os_drive()
     
     if not os_path: